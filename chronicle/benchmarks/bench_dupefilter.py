@@ -0,0 +1,54 @@
+# Per-request cost of chronicle.dupefilter.BloomDupeFilter against Scrapy's RFPDupeFilter, and a check that
+# a redirect to another form of the same url (/a/ -> /a, tracking parameters dropped) isn't filtered.
+#
+# Run from chronicle/ (where scrapy.cfg is):
+#   python -m benchmarks.bench_dupefilter [requests]
+import sys
+import time
+import warnings
+from scrapy import Request, Spider
+from scrapy.downloadermiddlewares.redirect import RedirectMiddleware
+from scrapy.dupefilters import RFPDupeFilter
+from scrapy.http import Response
+from scrapy.utils.test import get_crawler
+from chronicle.dupefilter import BloomDupeFilter
+
+URL = "https://www.chronicle.com/article/some-article-{}?utm_source=newsletter"
+REDIRECTS = [
+    ("https://www.chronicle.com/article/a/", "https://www.chronicle.com/article/a"),
+    ("https://www.chronicle.com/article/b", "https://www.chronicle.com/article/b/"),
+    ("https://www.chronicle.com/article/c?utm_source=x", "https://www.chronicle.com/article/c"),
+]
+
+
+def check_redirects():
+    # as the scheduler sees them: the first request, then the one RedirectMiddleware makes of its 301
+    crawler = get_crawler(Spider)
+    spider = crawler._create_spider("bench")
+    redirect_mw = RedirectMiddleware.from_crawler(crawler)
+    dupefilter = BloomDupeFilter()
+    for source, target in REDIRECTS:
+        request = Request(source)
+        assert not dupefilter.request_seen(request), source
+        response = Response(source, status=301, headers={"Location": target}, request=request)
+        redirected = redirect_mw.process_response(request, response, spider)
+        assert isinstance(redirected, Request) and not redirected.dont_filter, target
+        assert not dupefilter.request_seen(redirected), f"{source} -> {target} filtered"
+        assert dupefilter.request_seen(Request(target)), f"{target} not seen" # still a duplicate when found again
+    print(f"redirects: {len(REDIRECTS)} ok")
+
+
+def main(n):
+    warnings.simplefilter("ignore") # RFPDupeFilter's REQUEST_FINGERPRINTER_IMPLEMENTATION warning
+    check_redirects()
+    for name, dupefilter in (("rfp", RFPDupeFilter()), ("bloom", BloomDupeFilter())):
+        requests = [Request(URL.format(i % (n // 2))) for i in range(n)] # every url twice
+        started = time.perf_counter()
+        seen = sum(dupefilter.request_seen(request) for request in requests)
+        elapsed = time.perf_counter() - started
+        assert seen == n - n // 2, name
+        print(f"{name:>5}: {n} requests in {elapsed:.3f}s, {elapsed / n * 1e6:.1f} us/request")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
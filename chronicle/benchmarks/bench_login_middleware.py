@@ -0,0 +1,72 @@
+# Per-request overhead of LoginMiddleware + CookiesMiddleware once logged in.
+# "legacy" is the previous behavior: cookie dict rebuilt for every request and merged by CookiesMiddleware,
+# "header" is the current one: prebuilt Cookie header, CookiesMiddleware skipped.
+# Also checks which responses count as signed out (SIGN_IN_URL_PATTERNS match the url path, not any part of the url).
+#
+# Run from chronicle/ (where scrapy.cfg is):
+#   python -m benchmarks.bench_login_middleware [requests]
+import sys
+import time
+from scrapy import Request, Spider
+from scrapy.http import Response
+from scrapy.downloadermiddlewares.cookies import CookiesMiddleware
+from chronicle.middlewares import LoginMiddleware
+
+COOKIES = [
+    {"name": f"cookie{i}", "value": "x" * 40, "domain": ".qa.brightspot.chronicle.com", "path": "/"}
+    for i in range(12)
+]
+URL = "https://qa.brightspot.chronicle.com/article/some-article-{}"
+SIGN_IN_URL_PATTERNS = ["/login", "/authorize", "/u/login"]
+# (status, url, Location) -> signed out
+SIGNED_OUT = (
+    (401, "https://qa.brightspot.chronicle.com/article/a", None, True),
+    (302, "https://qa.brightspot.chronicle.com/article/a", "/u/login?state=abc", True),
+    (302, "https://qa.brightspot.chronicle.com/article/a", "https://auth.chronicle.com/authorize/resume?x=1", True),
+    (200, "https://qa.brightspot.chronicle.com/login/", None, True),
+    (200, "https://qa.brightspot.chronicle.com/article/login-tips-for-readers", None, False),
+    (200, "https://qa.brightspot.chronicle.com/article/a?next=/login", None, False),
+    (301, "https://qa.brightspot.chronicle.com/article/a", "/article/how-to-authorize-payments", False),
+    (200, "https://qa.brightspot.chronicle.com/loginhelp", None, False),
+)
+
+
+def legacy(requests, spider):
+    cookies_mw = CookiesMiddleware()
+    for request in requests:
+        request.cookies = {cookie['name']: cookie['value'] for cookie in COOKIES}
+        cookies_mw.process_request(request, spider)
+
+
+def header(requests, spider):
+    cookies_mw = CookiesMiddleware()
+    login_mw = LoginMiddleware()
+    login_mw.set_cookies(COOKIES)
+    login_mw.logged_in = True
+    for request in requests:
+        login_mw.process_request(request, spider)
+        cookies_mw.process_request(request, spider)
+
+
+def check_sign_in():
+    login_mw = LoginMiddleware(sign_in_patterns=SIGN_IN_URL_PATTERNS)
+    for status, url, location, signed_out in SIGNED_OUT:
+        headers = {"Location": location} if location else {}
+        assert login_mw.is_signed_out(Response(url, status=status, headers=headers)) == signed_out, (status, url, location)
+    print(f"sign in: {len(SIGNED_OUT)} responses classified as expected")
+
+
+def main(n):
+    check_sign_in()
+    spider = Spider("bench")
+    for name, run in (("legacy", legacy), ("header", header)):
+        requests = [Request(URL.format(i)) for i in range(n)]
+        started = time.perf_counter()
+        run(requests, spider)
+        elapsed = time.perf_counter() - started
+        assert requests[-1].headers.get("Cookie"), name
+        print(f"{name:>7}: {n} requests in {elapsed:.3f}s, {elapsed / n * 1e6:.1f} us/request")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,119 @@
+# Bytes and time the discovery spiders spend on article pages with and without DISCOVERY_STREAM_CLASSIFY
+# (download stopped at the article body tag), against gzipped pages of a local server. Also checks that
+# a gzipped 301 to a plain 200 article page is classified as it streams: the state of the first response
+# (gzip decoder, tail of the body) is not carried over to the redirected request.
+#
+# Run from chronicle/ (where scrapy.cfg is):
+#   python -m benchmarks.bench_stream_classify [pages]
+import gzip
+import os
+import random
+import sys
+import tempfile
+import time
+from scrapy.crawler import CrawlerRunner
+from twisted.internet import defer, reactor
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+from chronicle.spiders.ad import CLASSIFY_STATE, DiscoverySpider
+
+ARTICLE = (
+    b'<html><head><title>Article</title></head><body><div class="RichTextArticleBody-body RichTextBody">'
+    b"<p>First paragraph.</p></div><footer>" + random.Random(0).randbytes(100_000).hex().encode() + b"</footer></body></html>"
+)
+MOVED = b"<html><body>Moved to <a href='/article/target'>/article/target</a></body></html>"
+
+
+class Page(Resource):
+    isLeaf = True
+
+    def render_GET(self, request):
+        path = request.path.decode()
+        if path == "/article/moved":
+            request.setResponseCode(301)
+            request.setHeader(b"Location", b"/article/target")
+            request.setHeader(b"Content-Encoding", b"gzip")
+            return gzip.compress(MOVED)
+        if path == "/article/target":
+            return ARTICLE
+        request.setHeader(b"Content-Encoding", b"gzip")
+        return gzip.compress(ARTICLE)
+
+
+class BenchSpider(DiscoverySpider):
+    name = "bench-stream"
+
+    def __init__(self, *args, urls=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.urls = urls
+        self.responses = []
+        self.items = []
+
+    def start_requests(self):
+        for url in self.urls:
+            yield self.article_request(url)
+
+    def parse_article(self, response, url=None):
+        self.responses.append(response)
+        for item in super().parse_article(response, url):
+            self.items.append(item)
+            yield item
+
+
+@defer.inlineCallbacks
+def crawl(runner, urls, workdir, stream):
+    # in workdir: the spider's url index (urls.db) is not the one of real runs
+    crawler = runner.create_crawler(BenchSpider)
+    crawler.settings.set("DISCOVERY_STREAM_CLASSIFY", stream)
+    cwd = os.getcwd()
+    os.makedirs(workdir)
+    os.chdir(workdir)
+    try:
+        started = time.perf_counter()
+        yield runner.crawl(crawler, urls=urls)
+        elapsed = time.perf_counter() - started
+    finally:
+        os.chdir(cwd)
+    return crawler, crawler.spider.items, elapsed
+
+
+@defer.inlineCallbacks
+def run(pages):
+    port = reactor.listenTCP(0, Site(Page()), interface="127.0.0.1")
+    base_url = f"http://127.0.0.1:{port.getHost().port}"
+    settings = {
+        "BASE_URL": base_url,
+        "LOG_LEVEL": "ERROR",
+        "TELNETCONSOLE_ENABLED": False,
+        "REQUEST_FINGERPRINTER_IMPLEMENTATION": "2.7",
+    }
+    runner = CrawlerRunner(settings)
+    with tempfile.TemporaryDirectory() as tmp:
+        # gzipped 301 -> plain 200: stopped at the body tag, the redirected request starts without the 301's state
+        crawler, items, _ = yield crawl(runner, [f"{base_url}/article/moved"], os.path.join(tmp, "check"), True)
+        (response,) = crawler.spider.responses
+        assert response.url == f"{base_url}/article/target" and response.status == 200, response
+        assert "download_stopped" in response.flags, "redirected page downloaded in full"
+        assert not set(CLASSIFY_STATE) & set(response.meta), [key for key in CLASSIFY_STATE if key in response.meta]
+        assert len(items) == 1, items
+        print("gzip 301 -> plain 200: classified while streaming")
+
+        urls = [f"{base_url}/article/page-{i}" for i in range(pages)]
+        for stream in (False, True):
+            crawler, items, elapsed = yield crawl(runner, urls, os.path.join(tmp, f"stream-{stream}"), stream)
+            assert len(items) == pages, (stream, len(items))
+            received = crawler.stats.get_value("downloader/response_bytes")
+            print(f"stream {'on' if stream else 'off':>3}: {pages} pages in {elapsed:.3f}s, {received / pages:.0f} bytes/page")
+    yield port.stopListening()
+
+
+def main(pages):
+    failure = []
+    run(pages).addErrback(failure.append).addBoth(lambda _: reactor.stop())
+    reactor.run()
+    if failure:
+        failure[0].raiseException()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -0,0 +1,147 @@
+# Cost of the cleaning/validation path on the saved article bodies in benchmarks/fragments/, fully offline.
+# Stages, each timed per article:
+#   select     response.css(ARTICLE_BODY_CSS) on a whole page around the body (~300 KB: header, navigation, footer)
+#   extract    chronicle.extract.article_body on the same page
+#   clean      CleanData on a freshly parsed body (parsing is not timed)
+#   tests      RunTests(offset 3, frequency 3) on cleaned tokens
+#   grid       RunGridTests, the 49 offset/frequency pairs of BULK_TEST
+#   full       run_article_tests + log_report, what clean_data_and_run_tests does for one url
+#   full-bulk  the same with BULK_TEST
+# Prints p50/p90/p99 latency, throughput and peak memory (tracemalloc, separate pass) per stage and fragment.
+#
+# Run from chronicle/ (where scrapy.cfg is):
+#   python -m benchmarks.bench_validation [-n 50] [--verbose] [--json results.json] [--compare old.json]
+import argparse
+import glob
+import json
+import logging
+import os
+import time
+import tracemalloc
+from scrapy import Selector
+from scrapy.http import HtmlResponse
+from chronicle.extract import article_body
+from chronicle.snapshots import ARTICLE_BODY_CSS
+from chronicle.utils import CleanData, RunTests, RunGridTests, WorkerSpider, log_report, run_article_tests
+
+FRAGMENTS_DIR = os.path.join(os.path.dirname(__file__), "fragments")
+OFFSET = FREQUENCY = 3
+
+
+def load_fragments():
+    fragments = {}
+    for path in sorted(glob.glob(os.path.join(FRAGMENTS_DIR, "*.html"))):
+        with open(path, "r", encoding="utf-8") as f:
+            fragments[os.path.splitext(os.path.basename(path))[0]] = f.read()
+    return fragments
+
+
+# Page around the article body, sized like a real one
+PAGE_HEAD = ("<!DOCTYPE html><html><head><title>Article</title><style>/*" + "x" * 100 * 1024 + "*/</style></head><body>"
+             "<header><nav>" + "<div class=\"NavigationItem\"><a href=\"/section\">Section</a></div>" * 1000 + "</nav></header>"
+             "<main><h1>Article</h1>")
+PAGE_TAIL = "</main><footer>" + "<div class=\"Promo\"><p>Related article</p></div>" * 2000 + "</footer></body></html>"
+
+
+def parse(html):
+    return Selector(text=html).css(ARTICLE_BODY_CSS)
+
+
+def page(html):
+    body = (PAGE_HEAD + html + PAGE_TAIL).encode("utf-8")
+    return lambda: HtmlResponse(url="https://example.com/article/bench", body=body, encoding="utf-8")
+
+
+def full(spider, html, bulk_test):
+    article = parse(html)
+    def run():
+        results = run_article_tests(spider, article, OFFSET, FREQUENCY, bulk_test)
+        for (offset, frequency), report in results.items():
+            log_report(spider, "bench", offset, frequency, report)
+    return run
+
+
+# stage -> function(spider, html) returning the callable to time; setup (parsing, cleaning) is done outside of it
+STAGES = {
+    "select": lambda spider, html: (lambda response=page(html): response().css(ARTICLE_BODY_CSS).get()),
+    "extract": lambda spider, html: (lambda response=page(html): article_body(response()).get()),
+    "clean": lambda spider, html: (lambda article=parse(html): CleanData(spider, article)),
+    "tests": lambda spider, html: (lambda tokens=CleanData(spider, parse(html)).tokens: RunTests(spider, tokens, OFFSET, FREQUENCY)),
+    "grid": lambda spider, html: (lambda tokens=CleanData(spider, parse(html)).tokens: RunGridTests(spider, tokens)),
+    "full": lambda spider, html: full(spider, html, False),
+    "full-bulk": lambda spider, html: full(spider, html, True),
+}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def measure(spider, stage, html, iterations):
+    setup = STAGES[stage]
+    timings = []
+    for _ in range(iterations):
+        run = setup(spider, html)
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+
+    run = setup(spider, html)
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "p50_ms": percentile(timings, 50) * 1e3,
+        "p90_ms": percentile(timings, 90) * 1e3,
+        "p99_ms": percentile(timings, 99) * 1e3,
+        "per_second": len(timings) / sum(timings),
+        "peak_kib": peak / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CleanData/RunTests on saved article bodies")
+    parser.add_argument("-n", "--iterations", type=int, default=50)
+    parser.add_argument("--stage", action="append", choices=list(STAGES), help="default: all stages")
+    parser.add_argument("--fragment", action="append", help="default: all of benchmarks/fragments/")
+    parser.add_argument("--verbose", action="store_true", help="INFO logs on, as with VERBOSE = True")
+    parser.add_argument("--json", help="save results to this file")
+    parser.add_argument("--compare", help="results file of an earlier run, p50 change is printed")
+    args = parser.parse_args()
+
+    spider = WorkerSpider("bench")
+    spider.logger.addHandler(logging.NullHandler()) # records are built as in a crawl, but not written
+    spider.logger.propagate = False
+    spider.logger.setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    fragments = load_fragments()
+    if args.fragment:
+        fragments = {name: html for name, html in fragments.items() if name in args.fragment}
+    previous = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+
+    results = {}
+    print(f"{'stage':<10} {'fragment':<16} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'art/s':>9} {'peak KiB':>9}")
+    for stage in args.stage or STAGES:
+        for name, html in fragments.items():
+            result = measure(spider, stage, html, args.iterations)
+            results[f"{stage}/{name}"] = result
+            line = (f"{stage:<10} {name:<16} {result['p50_ms']:>9.3f} {result['p90_ms']:>9.3f} {result['p99_ms']:>9.3f} "
+                    f"{result['per_second']:>9.1f} {result['peak_kib']:>9.1f}")
+            before = previous.get(f"{stage}/{name}")
+            if before:
+                line += f"  p50 {(result['p50_ms'] / before['p50_ms'] - 1) * 100:+.1f}%"
+            print(line)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
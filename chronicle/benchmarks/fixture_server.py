@@ -0,0 +1,291 @@
+# Local stand-in for qa.brightspot.chronicle.com, to measure crawl throughput without touching QA:
+#   /                      home page, "Sign In" link, user-menu-trigger button when signed in (session probe)
+#   /u/login               sign in form with the ids LoginMiddleware.login_user fills in, POST sets the session cookie
+#   /article/?p=N          ListLoadMore page of ArticleLatestSpider
+#   /search-legacy/?p=N    search results of ArticleSearchSpider
+#   /article/<slug>        article page with a body from benchmarks/fragments/ (every --blog-every'th one has none),
+#                          ETag and If-None-Match -> 304
+#   /sitemap.xml           sitemap index of /sitemaps/articles-N.xml (--sitemap-size urls each, .xml.gz with --sitemap-gzip),
+#                          article N was modified N days before 2026-01-01, every child sitemap lists a section page too
+# Pages other than /, /u/login and the sitemaps redirect to /u/login without a session cookie (--no-auth to serve them openly).
+# --latency/--jitter delay responses without blocking the server, --error-rate answers crawled pages with 503s (retried by Scrapy),
+# --max-inflight does the same for requests over that many at once, like an overloaded host.
+# --gzip compresses responses for clients that accept it (Content-Encoding: gzip), as most hosts do.
+#
+# Run from chronicle/ (where scrapy.cfg is), --seed-session writes a session the LoginMiddleware reuses, no browser needed:
+#   python -m benchmarks.fixture_server --port 8080 --latency 0.05 --seed-session .session/cookies.json
+#   scrapy crawl article-latest -s BASE_URL=http://127.0.0.1:8080
+# Requests/sec of the server are printed every --report-every seconds and on exit.
+import argparse
+import datetime
+import gzip
+import hashlib
+import html
+import os
+import random
+import secrets
+import time
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+from twisted.web import resource, server
+from twisted.web.util import redirectTo
+from benchmarks.bench_validation import load_fragments
+from chronicle.session import SessionCache
+
+SESSION_COOKIE = b"fixture_session"
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>{title}</title>
+<style>{padding}</style>
+</head><body>
+<header class="Page-header">{header}</header>
+<main class="Page-main">{main}</main>
+</body></html>
+"""
+
+LATEST_CARD = """<div class="ContentPromo-side"><div class="ContentPromo-side-title"><a href="{href}">{title}</a></div></div>"""
+SEARCH_CARD = """<div class="PromoSearchResult"><div class="PromoSearchResult-title"><a href="{href}">{title}</a></div></div>"""
+SITEMAP_DAY = datetime.date(2026, 1, 1)
+SITEMAP_NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+LOGIN_FORM = """<form method="post" action="/u/login">
+<input id="1-email" name="email" type="email"><input id="1-password" name="password" type="password">
+<button id="1-submit" type="submit">Log In</button></form>"""
+
+
+class FixtureSite(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, options):
+        super().__init__()
+        self.options = options
+        self.random = random.Random(options.seed)
+        self.fragments = list(load_fragments().values())
+        self.padding = "/*" + "x" * (options.padding_kb * 1024) + "*/" # page bytes before the article body
+        self.sessions = set()
+        self.started = self.last_report = time.monotonic()
+        self.served = self.last_served = 0
+        self.inflight = 0
+        self.statuses = {}
+
+    def new_session(self):
+        token = secrets.token_hex(16)
+        self.sessions.add(token)
+        return token
+
+    def signed_in(self, request):
+        return self.options.no_auth or (request.getCookie(SESSION_COOKIE) or b"").decode() in self.sessions
+
+    def render(self, request):
+        self.served += 1
+        self.inflight += 1
+        delay = max(0.0, self.options.latency + self.random.uniform(-self.options.jitter, self.options.jitter))
+        if request.path in (b"/", b"/u/login"): # the sign in flow and the session probe are left alone
+            handler = self.route(request)
+        elif self.random.random() < self.options.error_rate:
+            handler = self.error
+        elif self.options.max_inflight and self.inflight > self.options.max_inflight:
+            handler = self.error # overloaded
+        else:
+            handler = self.route(request)
+        if delay:
+            reactor.callLater(delay, self.finish, request, handler)
+            return server.NOT_DONE_YET
+        return self.respond(request, handler)
+
+    def finish(self, request, handler):
+        body = self.respond(request, handler)
+        if not request._disconnected:
+            request.write(body)
+            request.finish()
+
+    def respond(self, request, handler):
+        self.inflight -= 1
+        body = handler(request)
+        self.statuses[request.code] = self.statuses.get(request.code, 0) + 1
+        body = body if isinstance(body, bytes) else body.encode("utf-8")
+        if self.options.gzip and body and b"gzip" in (request.getHeader(b"accept-encoding") or b"") \
+                and not request.responseHeaders.hasHeader(b"content-encoding") and not body.startswith(b"\x1f\x8b"):
+            request.setHeader("Content-Encoding", "gzip")
+            body = gzip.compress(body)
+        return body
+
+    def route(self, request):
+        path = request.path.decode()
+        if path == "/":
+            return self.home
+        if path == "/u/login":
+            return self.login
+        if path == "/sitemap.xml":
+            return self.sitemap_index
+        if path.startswith("/sitemaps/"):
+            return self.sitemap
+        if not self.signed_in(request):
+            return self.sign_in_redirect
+        if path == "/article/":
+            return self.latest
+        if path == "/search-legacy/":
+            return self.search
+        if path.startswith("/article/"):
+            return self.article
+        return self.not_found
+
+    # Pages
+
+    def page(self, title, main, request):
+        if self.signed_in(request):
+            header = '<button class="user-menu-trigger">Account</button>'
+        else:
+            header = '<a href="/u/login">Sign In</a>'
+        return PAGE.format(title=html.escape(title), padding=self.padding, header=header, main=main)
+
+    def home(self, request):
+        return self.page("The Chronicle", "<h1>Home</h1>", request)
+
+    def login(self, request):
+        if request.method == b"POST":
+            request.addCookie(SESSION_COOKIE, self.new_session(), path="/", httpOnly=True)
+            return redirectTo(b"/", request)
+        return self.page("Sign In", LOGIN_FORM, request)
+
+    def sign_in_redirect(self, request):
+        return redirectTo(b"/u/login?next=" + request.uri, request)
+
+    def error(self, request):
+        request.setResponseCode(503)
+        return b"Service Unavailable"
+
+    def not_found(self, request):
+        request.setResponseCode(404)
+        return self.page("Not Found", "<h1>Not Found</h1>", request)
+
+    def page_number(self, request):
+        try:
+            return max(1, int(request.args.get(b"p", [b"1"])[0]))
+        except ValueError:
+            return 1
+
+    def page_ids(self, page):
+        first = (page - 1) * self.options.page_size + 1
+        return range(first, min(first + self.options.page_size, self.options.articles + 1))
+
+    def latest(self, request):
+        page = self.page_number(request)
+        ids = self.page_ids(page)
+        cards = "".join(LATEST_CARD.format(href=f"/article/fixture-article-{i}", title=f"Article {i}") for i in ids)
+        next_page = ""
+        if ids and ids[-1] < self.options.articles:
+            next_page = f'<div class="ListLoadMore-nextPage"><a href="/article/?p={page + 1}">Load More</a></div>'
+        return self.page("Latest", f'<div class="ListLoadMore"><div class="ListLoadMore-items">{cards}</div>{next_page}</div>', request)
+
+    def search(self, request):
+        origin = f"http://{request.getHeader('host')}" # search results link with absolute urls
+        cards = "".join(
+            SEARCH_CARD.format(href=f"{origin}/article/fixture-article-{i}", title=f"Article {i}")
+            for i in self.page_ids(self.page_number(request))
+        )
+        return self.page("Search", f'<div class="SearchResultsModule-results">{cards}</div>', request)
+
+    def article(self, request):
+        slug = request.path.decode().rsplit("/", 1)[-1]
+        try:
+            number = int(slug.rsplit("-", 1)[-1])
+        except ValueError:
+            return self.not_found(request)
+        if self.options.blog_every and number % self.options.blog_every == 0:
+            main = f"<h1>Blog post {number}</h1><div class=\"BlogPostBody\"><p>Not an article.</p></div>"
+        else:
+            main = f"<h1>Article {number}</h1>" + self.fragments[number % len(self.fragments)]
+        body = self.page(f"Article {number}", main, request).encode("utf-8")
+
+        etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+        request.setHeader("ETag", etag)
+        if request.getHeader("if-none-match") == etag:
+            request.setResponseCode(304)
+            return b""
+        return body
+
+    # Sitemaps
+
+    def lastmod(self, number):
+        return (SITEMAP_DAY - datetime.timedelta(days=number)).isoformat()
+
+    def sitemap_index(self, request):
+        origin = f"http://{request.getHeader('host')}"
+        extension = "xml.gz" if self.options.sitemap_gzip else "xml"
+        entries = "".join(
+            f"<sitemap><loc>{origin}/sitemaps/articles-{child}.{extension}</loc><lastmod>{self.lastmod(first)}</lastmod></sitemap>"
+            for child, first in enumerate(range(1, self.options.articles + 1, self.options.sitemap_size), start=1)
+        )
+        request.setHeader("Content-Type", "application/xml")
+        return f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{SITEMAP_NS}">{entries}</sitemapindex>'
+
+    def sitemap(self, request):
+        name = request.path.decode().rsplit("/", 1)[-1]
+        try:
+            child = int(name.split("-", 1)[1].split(".", 1)[0])
+        except (IndexError, ValueError):
+            return self.not_found(request)
+        origin = f"http://{request.getHeader('host')}"
+        first = (child - 1) * self.options.sitemap_size + 1
+        numbers = range(first, min(first + self.options.sitemap_size, self.options.articles + 1))
+        entries = f"<url><loc>{origin}/section/news-{child}</loc></url>" + "".join(
+            f"<url><loc>{origin}/article/fixture-article-{i}</loc><lastmod>{self.lastmod(i)}</lastmod></url>" for i in numbers
+        )
+        body = f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{SITEMAP_NS}">{entries}</urlset>'.encode("utf-8")
+        if name.endswith(".gz"):
+            request.setHeader("Content-Type", "application/gzip")
+            return gzip.compress(body)
+        request.setHeader("Content-Type", "application/xml")
+        return body
+
+    # Throughput
+
+    def report(self):
+        now = time.monotonic()
+        rate = (self.served - self.last_served) / max(now - self.last_report, 1e-9)
+        print(f"{self.served} requests, {rate:.1f} req/s, statuses {dict(sorted(self.statuses.items()))}", flush=True)
+        self.last_report, self.last_served = now, self.served
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        print(f"Served {self.served} requests in {elapsed:.1f}s ({self.served / max(elapsed, 1e-9):.1f} req/s), "
+              f"statuses {dict(sorted(self.statuses.items()))}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fixture site for crawl benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--articles", type=int, default=1000)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--blog-every", type=int, default=5, help="every n-th page has no article body, 0: none")
+    parser.add_argument("--padding-kb", type=int, default=50, help="page bytes before the article body")
+    parser.add_argument("--sitemap-size", type=int, default=500, help="urls per child sitemap")
+    parser.add_argument("--sitemap-gzip", action="store_true", help="serve the child sitemaps gzipped")
+    parser.add_argument("--gzip", action="store_true", help="gzip responses when the client accepts it")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds around --latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of responses answered with 503")
+    parser.add_argument("--max-inflight", type=int, default=0, help="503 for requests over this many in progress, 0: no limit")
+    parser.add_argument("--no-auth", action="store_true", help="serve every page without a session cookie")
+    parser.add_argument("--seed-session", help="write a valid session for LoginMiddleware to this SESSION_FILE")
+    parser.add_argument("--report-every", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args()
+
+    site = FixtureSite(options)
+    if options.seed_session:
+        cookie = {"name": SESSION_COOKIE.decode(), "value": site.new_session(), "domain": options.host, "path": "/"}
+        SessionCache(options.seed_session).save([cookie])
+        print(f"Session written to {os.path.abspath(options.seed_session)}")
+
+    reactor.listenTCP(options.port, server.Site(site), interface=options.host)
+    if options.report_every > 0:
+        LoopingCall(site.report).start(options.report_every, now=False)
+    reactor.addSystemEventTrigger("before", "shutdown", site.summary)
+    print(f"Serving on http://{options.host}:{options.port}/", flush=True)
+    reactor.run()
+
+
+if __name__ == "__main__":
+    main()
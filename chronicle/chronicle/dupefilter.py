@@ -0,0 +1,159 @@
+import hashlib
+import math
+import os
+import re
+import struct
+from fnmatch import translate
+from functools import lru_cache
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from scrapy.dupefilters import RFPDupeFilter
+from scrapy.utils.job import job_dir
+from w3lib.url import canonicalize_url
+
+# Query parameters that don't change the page (fnmatch patterns, compared lowercased)
+TRACKING_PARAMS = ("utm_*", "fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "_ga", "_gl", "cmpid")
+DEFAULT_PORTS = {"http": 80, "https": 443}
+# Urls canonical but for the port and the trailing slash: no query or fragment, nothing to quote or lowercase
+PLAIN_URL = re.compile(r"(https?)://([a-z0-9.-]+)(?::(\d+))?(/[A-Za-z0-9_~/-]*(?:\.[A-Za-z0-9_~-]+)*)?")
+BLOOM_FILE = "requests.bloom"
+BLOOM_HEADER = struct.Struct("<8sQIQ") # magic, bits, hashes, items added
+BLOOM_MAGIC = b"CHRBLOOM"
+
+
+@lru_cache(maxsize=8)
+def _params_pattern(drop_params):
+    return re.compile("|".join(translate(pattern.lower()) for pattern in drop_params) or r"(?!)")
+
+
+def canonical_url(url, drop_params=TRACKING_PARAMS):
+    # One form for the urls of the same page: lowercase scheme and host, no default port, no fragment,
+    # no tracking parameters, the others sorted, no trailing slash (but "/")
+    plain = PLAIN_URL.fullmatch(url)
+    if plain:
+        scheme, host, port, path = plain.groups()
+        if port and int(port) != DEFAULT_PORTS[scheme]:
+            host += f":{port}"
+        return f"{scheme}://{host}{(path or '').rstrip('/') or '/'}"
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc += f":{parts.port}"
+    query = parts.query
+    if query:
+        drop = _params_pattern(tuple(drop_params))
+        query = urlencode([
+            (name, value) for name, value in parse_qsl(query, keep_blank_values=True) if not drop.match(name.lower())
+        ])
+    if not query and PLAIN_URL.fullmatch(f"{scheme}://{netloc}{parts.path}"):
+        return canonical_url(f"{scheme}://{netloc}{parts.path}") # only tracking parameters or a fragment
+    path = parts.path.rstrip("/") or "/"
+    return canonicalize_url(urlunsplit((scheme, netloc, path, query, "")))
+
+
+def request_fingerprint(request, drop_params=TRACKING_PARAMS):
+    # Method, canonical url and body, as Scrapy's fingerprint without headers (its url canonicalization is in canonical_url)
+    fingerprint = hashlib.sha1(request.method.encode("ascii"))
+    fingerprint.update(canonical_url(request.url, drop_params).encode("utf-8"))
+    fingerprint.update(request.body or b"")
+    return fingerprint.digest()
+
+
+class BloomFilter:
+    """FIXED SIZE SET OF 20 BYTE FINGERPRINTS, FALSE POSITIVES AT error_rate UP TO capacity ITEMS. NO FALSE NEGATIVES."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, fingerprint):
+        # the fingerprint is a hash already, two halves of it give every position (double hashing)
+        first = int.from_bytes(fingerprint[:8], "little")
+        second = int.from_bytes(fingerprint[8:16], "little") | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def add(self, fingerprint):
+        # True if it was (probably) in already
+        seen = True
+        for position in self._positions(fingerprint):
+            byte, bit = divmod(position, 8)
+            if not self.array[byte] & (1 << bit):
+                self.array[byte] |= 1 << bit
+                seen = False
+        if not seen:
+            self.count += 1
+        return seen
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(BLOOM_HEADER.pack(BLOOM_MAGIC, self.bits, self.hashes, self.count))
+            f.write(self.array)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        # False if the file was written with another size or error rate (left as is)
+        with open(path, "rb") as f:
+            magic, bits, hashes, count = BLOOM_HEADER.unpack(f.read(BLOOM_HEADER.size))
+            if magic != BLOOM_MAGIC or bits != self.bits or hashes != self.hashes:
+                return False
+            self.array = bytearray(f.read())
+        self.count = count
+        return len(self.array) == (self.bits + 7) // 8
+
+
+# Drop-in replacement of Scrapy's RFPDupeFilter: fingerprints of canonical urls (request_fingerprint), kept in a Bloom filter
+# of DUPEFILTER_CAPACITY at DUPEFILTER_ERROR_RATE instead of a set of every fingerprint. With JOBDIR it is saved
+# in JOBDIR/requests.bloom when the crawl closes and loaded again on resume, as requests.seen is.
+# A false positive drops a request never made before: DUPEFILTER_ERROR_RATE of them, more past DUPEFILTER_CAPACITY.
+# A redirect to another form of an url of its chain (/a/ -> /a, ?utm_source=x -> no query) is let through.
+class BloomDupeFilter(RFPDupeFilter):
+    def __init__(self, path=None, debug=False, *, fingerprinter=None, capacity=1_000_000, error_rate=0.001,
+                 drop_params=TRACKING_PARAMS):
+        super().__init__(None, debug, fingerprinter=fingerprinter) # no requests.seen
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.drop_params = tuple(drop_params)
+        self.warned_full = False
+        self.path = os.path.join(path, BLOOM_FILE) if path else None
+        if self.path and os.path.exists(self.path):
+            if self.bloom.load(self.path):
+                self.logger.info(f"Resumed {self.bloom.count} seen requests from {self.path}")
+            else:
+                self.bloom = BloomFilter(capacity, error_rate)
+                self.logger.warning(f"{self.path} has another DUPEFILTER_CAPACITY/ERROR_RATE, starting empty")
+
+    @classmethod
+    def from_settings(cls, settings, *, fingerprinter=None):
+        return cls(
+            job_dir(settings),
+            settings.getbool("DUPEFILTER_DEBUG"),
+            fingerprinter=fingerprinter,
+            capacity=settings.getint("DUPEFILTER_CAPACITY", 1_000_000),
+            error_rate=settings.getfloat("DUPEFILTER_ERROR_RATE", 0.001),
+            drop_params=settings.getlist("CANONICAL_DROP_PARAMS", TRACKING_PARAMS),
+        )
+
+    def request_fingerprint(self, request):
+        return request_fingerprint(request, self.drop_params)
+
+    def request_seen(self, request):
+        redirect_urls = request.meta.get("redirect_urls")
+        if redirect_urls:
+            url = canonical_url(request.url, self.drop_params)
+            if any(canonical_url(source, self.drop_params) == url for source in redirect_urls):
+                return False # the same page, recorded with the first url of the chain
+        seen = self.bloom.add(self.request_fingerprint(request))
+        if not seen and self.bloom.count > self.bloom.capacity and not self.warned_full:
+            self.warned_full = True
+            self.logger.warning(
+                f"More than DUPEFILTER_CAPACITY={self.bloom.capacity} requests, new ones are dropped more often than "
+                "DUPEFILTER_ERROR_RATE, raise it"
+            )
+        return seen
+
+    def close(self, reason):
+        if self.path:
+            self.bloom.save(self.path)
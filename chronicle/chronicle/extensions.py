@@ -0,0 +1,261 @@
+import re
+import time
+from collections import deque
+from statistics import median
+from itemadapter import ItemAdapter
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet.task import LoopingCall
+from chronicle.items import ArticleItem
+from chronicle.metrics import StageMetrics
+
+# Endpoint class of a request by url path, each class gets its own download slot and concurrency
+ENDPOINT_CLASSES = (
+    ("search", re.compile(r"^/search-legacy/")),
+    ("listing", re.compile(r"^/article/?$")),
+    ("article", re.compile(r"^/article/.")),
+)
+ERROR_STATUSES = {408, 429, 500, 502, 503, 504, 520, 521, 522, 524}
+
+
+def endpoint_class(request):
+    path = urlparse_cached(request).path
+    for name, pattern in ENDPOINT_CLASSES:
+        if pattern.match(path):
+            return name
+    return "other"
+
+
+class EndpointState:
+    """CONCURRENCY OF ONE ENDPOINT CLASS AND THE OUTCOMES (LATENCY, ERROR) OF ITS CURRENT WINDOW."""
+    __slots__ = ("concurrency", "latencies", "errors", "responses", "baseline", "peak")
+
+    def __init__(self, concurrency, window):
+        self.concurrency = concurrency
+        self.latencies = deque(maxlen=window)
+        self.errors = 0
+        self.responses = 0
+        self.baseline = None # lowest median latency of a window, what the host does when it isn't loaded
+        self.peak = concurrency
+
+    def reset(self):
+        self.latencies.clear()
+        self.errors = 0
+        self.responses = 0
+
+
+# Adaptive concurrency per endpoint class (listing, search page, article). Every class is a separate download slot,
+# after each window of responses its concurrency goes up by one while latency stays near the baseline and errors are rare,
+# drops by one when latency grows, and is halved when the error rate is over ADAPTIVE_CONCURRENCY_ERROR_RATE.
+# CONCURRENT_REQUESTS stays the ceiling of all classes together. Decisions are in the stats (adaptive_concurrency/...).
+class AdaptiveConcurrency:
+    def __init__(self, crawler, start, minimum, maximum, window, error_rate, latency_factor):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.start = start
+        self.minimum = minimum
+        self.maximum = maximum
+        self.window = window
+        self.error_rate = error_rate
+        self.latency_factor = latency_factor
+        self.endpoints = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("ADAPTIVE_CONCURRENCY_ENABLED"):
+            raise NotConfigured
+        maximum = settings.getint("ADAPTIVE_CONCURRENCY_MAX", 32)
+        minimum = settings.getint("ADAPTIVE_CONCURRENCY_MIN", 1)
+        extension = cls(
+            crawler,
+            start=min(max(settings.getint("ADAPTIVE_CONCURRENCY_START", 8), minimum), maximum),
+            minimum=minimum,
+            maximum=maximum,
+            window=settings.getint("ADAPTIVE_CONCURRENCY_WINDOW", 50),
+            error_rate=settings.getfloat("ADAPTIVE_CONCURRENCY_ERROR_RATE", 0.1),
+            latency_factor=settings.getfloat("ADAPTIVE_CONCURRENCY_LATENCY_FACTOR", 2.0),
+        )
+        crawler.signals.connect(extension.request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(extension.request_reached_downloader, signal=signals.request_reached_downloader)
+        crawler.signals.connect(extension.response_downloaded, signal=signals.response_downloaded)
+        crawler.signals.connect(extension.request_left_downloader, signal=signals.request_left_downloader)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def state(self, name):
+        state = self.endpoints.get(name)
+        if state is None:
+            state = self.endpoints[name] = EndpointState(self.start, self.window)
+            self.stats.set_value(f"adaptive_concurrency/{name}/concurrency", state.concurrency)
+        return state
+
+    def request_scheduled(self, request, spider):
+        # slot key has to be set before the downloader picks the slot
+        if "download_slot" not in request.meta:
+            name = endpoint_class(request)
+            request.meta["download_slot"] = f"{urlparse_cached(request).hostname}:{name}"
+            request.meta["endpoint_class"] = name
+
+    def request_reached_downloader(self, request, spider):
+        name = request.meta.get("endpoint_class")
+        if name is None:
+            return
+        slot = self.crawler.engine.downloader.slots.get(request.meta.get("download_slot"))
+        state = self.state(name)
+        if slot is not None and slot.concurrency != state.concurrency:
+            slot.concurrency = state.concurrency # new slot, or recreated after the idle ones were collected
+
+    def response_downloaded(self, response, request, spider):
+        name = request.meta.get("endpoint_class")
+        if name is None:
+            return
+        request.meta["endpoint_response"] = True
+        latency = request.meta.get("download_latency")
+        self.outcome(name, latency, response.status in ERROR_STATUSES, spider)
+
+    def request_left_downloader(self, request, spider):
+        # download errors (timeouts, refused connections) never reach response_downloaded
+        name = request.meta.get("endpoint_class")
+        if name is None or request.meta.pop("endpoint_response", False):
+            return
+        self.outcome(name, None, True, spider)
+
+    def outcome(self, name, latency, error, spider):
+        state = self.state(name)
+        state.responses += 1
+        self.stats.inc_value(f"adaptive_concurrency/{name}/responses")
+        if latency is not None:
+            state.latencies.append(latency)
+        if error:
+            state.errors += 1
+            self.stats.inc_value(f"adaptive_concurrency/{name}/errors")
+
+        # A burst of errors backs off before the window is full
+        if state.errors > 2 * self.error_rate * self.window or state.responses >= self.window:
+            self.evaluate(name, state, spider)
+
+    def evaluate(self, name, state, spider):
+        if state.errors > self.error_rate * max(state.responses, self.window):
+            self.adjust(name, state, max(self.minimum, state.concurrency // 2), "errors", spider)
+            return
+        if not state.latencies:
+            state.reset()
+            return
+        latency = median(state.latencies)
+        self.stats.set_value(f"adaptive_concurrency/{name}/latency_ms", round(latency * 1000, 1))
+        if state.baseline is None or latency < state.baseline:
+            state.baseline = latency
+        if latency > state.baseline * self.latency_factor:
+            self.adjust(name, state, max(self.minimum, state.concurrency - 1), "latency", spider)
+        else:
+            self.adjust(name, state, min(self.maximum, state.concurrency + 1), "increase", spider)
+
+    def adjust(self, name, state, concurrency, reason, spider):
+        state.reset()
+        if concurrency == state.concurrency:
+            return
+        spider.logger.info(f"Concurrency of {name} requests {state.concurrency} -> {concurrency} ({reason})")
+        self.stats.inc_value(f"adaptive_concurrency/{name}/{'increases' if concurrency > state.concurrency else 'decreases'}")
+        state.concurrency = concurrency
+        state.peak = max(state.peak, concurrency)
+        self.stats.set_value(f"adaptive_concurrency/{name}/concurrency", concurrency)
+        self.stats.set_value(f"adaptive_concurrency/{name}/peak_concurrency", state.peak)
+        for key, slot in self.crawler.engine.downloader.slots.items():
+            if key.endswith(f":{name}"):
+                slot.concurrency = concurrency
+
+    def spider_closed(self, spider, reason):
+        # where each class settled, also in the stats (adaptive_concurrency/...) that the default logging filters out
+        for name, state in sorted(self.endpoints.items()):
+            spider.logger.warning(f"Concurrency of {name} requests: {state.concurrency} at the end, {state.peak} at most")
+
+
+# Per-stage duration histograms (p50/p95/p99) of a crawl: download, login middleware, selector, CleanData, RunTests,
+# plus passed/failed/soft error counts and articles/sec. Pushed to the stats every STAGE_METRICS_INTERVAL seconds and at
+# the end, when they are also logged by the spider, saved to STAGE_METRICS_FILE as JSON and, with STAGE_METRICS_PROMETHEUS,
+# to a Prometheus text file rewritten with the stats.
+class StageTimings:
+    def __init__(self, crawler, json_path=None, prometheus_path=None, interval=0):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.json_path = json_path
+        self.prometheus_path = prometheus_path
+        self.interval = interval
+        self.metrics = StageMetrics()
+        self.timer = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("STAGE_METRICS_ENABLED"):
+            raise NotConfigured
+        extension = cls(
+            crawler,
+            json_path=settings.get("STAGE_METRICS_FILE"),
+            prometheus_path=settings.get("STAGE_METRICS_PROMETHEUS"),
+            interval=settings.getfloat("STAGE_METRICS_INTERVAL", 60),
+        )
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(extension.response_received, signal=signals.response_received)
+        crawler.signals.connect(extension.item_scraped, signal=signals.item_scraped)
+        return extension
+
+    def spider_opened(self, spider):
+        spider.stage_metrics = self.metrics # picked up by chronicle.metrics.record()
+        self.metrics.started = time.time()
+        if self.interval > 0:
+            self.timer = LoopingCall(self.export)
+            self.timer.start(self.interval, now=False)
+
+    def export(self):
+        self.push_stats()
+        if self.prometheus_path:
+            self.metrics.save(self.prometheus_path, prometheus=True)
+
+    def push_stats(self):
+        for stage, histogram in self.metrics.stages.items():
+            for key, value in histogram.summary().items():
+                self.stats.set_value(f"stage_timings/{stage}/{key}", value)
+        for name, count in self.metrics.counters.items():
+            self.stats.set_value(f"stage_timings/{name}", count)
+        self.stats.set_value("stage_timings/articles_per_second", self.metrics.articles_per_second())
+
+    def response_received(self, response, request, spider):
+        latency = request.meta.get("download_latency")
+        if latency is not None:
+            self.metrics.record("download", latency)
+
+    def item_scraped(self, item, response, spider):
+        if not isinstance(item, ArticleItem):
+            return
+        reports = ItemAdapter(item).get("reports") or {}
+        if not reports:
+            return
+        self.metrics.inc("articles")
+        timings = next(iter(reports.values())).get("timings") or {} # measured once per article, in the worker if any
+        for stage, seconds in timings.items():
+            self.metrics.record(stage, seconds)
+        for report in reports.values():
+            if any("[SOFTERROR]" in detail for detail in report.get("details") or []):
+                self.metrics.inc("tests_soft_errors")
+            self.metrics.inc("tests_passed" if report.get("status") else "tests_failed")
+
+    def spider_closed(self, spider, reason):
+        if self.timer and self.timer.running:
+            self.timer.stop()
+        self.export()
+        # Scrapy's stats dump is filtered out with DEFAULT_LOGS_DISABLED and below LOG_LEVEL, the summary is logged here
+        counters = ", ".join(f"{name}: {count}" for name, count in sorted(self.metrics.counters.items()))
+        spider.logger.warning(f"Stage timings ({self.metrics.articles_per_second()} articles/s; {counters})")
+        for stage, histogram in self.metrics.stages.items():
+            summary = histogram.summary()
+            spider.logger.warning(
+                f"  {stage}: {summary['count']} times, p50 {summary['p50_ms']} ms, p95 {summary['p95_ms']} ms, "
+                f"p99 {summary['p99_ms']} ms"
+            )
+        if self.json_path:
+            self.metrics.save(self.json_path)
+            spider.logger.info(f"Stage timings saved to {self.json_path}")
@@ -0,0 +1,81 @@
+import codecs
+import re
+import time
+import weakref
+from lxml import etree
+from parsel import Selector, SelectorList
+from chronicle.metrics import record
+
+# ARTICLE_BODY_CSS (chronicle.snapshots) as a tag and the classes it must have
+ARTICLE_BODY_ELEMENT = "div"
+ARTICLE_BODY_CLASSES = frozenset(("RichTextArticleBody-body", "RichTextBody"))
+ARTICLE_BODY_MARKER = b"RichTextArticleBody-body"
+ARTICLE_BODY_START = re.compile(rb"<div\b[^>]*RichTextArticleBody-body")
+CHUNK_SIZE = 16 * 1024
+
+_bodies = weakref.WeakKeyDictionary() # response -> SelectorList, one extraction per response
+
+
+def _is_article_body(element):
+    return ARTICLE_BODY_CLASSES.issubset((element.get("class") or "").split())
+
+
+def _parse_from(body):
+    # Where parsing can start: the opening tag of the article body, found by a byte search, unless it may be
+    # inside a <script> or a comment. The header, navigation etc. before it are never parsed
+    match = ARTICLE_BODY_START.search(body)
+    if match is None:
+        return 0
+    start = match.start()
+    if body.count(b"<script", 0, start) != body.count(b"</script", 0, start) or body.count(b"<!--", 0, start) != body.count(b"-->", 0, start):
+        return 0
+    return start
+
+
+def extract_article_body(body, start_only=False, chunk_size=CHUNK_SIZE):
+    # First article body element of utf-8 html, None if there is none. The page is parsed in chunks (iterparse style),
+    # from the body's opening tag when possible, and parsing stops once the body is closed (opened, with start_only).
+    # Divs that close before the body opens are emptied on the way, only the body subtree is kept
+    if ARTICLE_BODY_MARKER not in body:
+        return None # no article body, nothing to parse
+    parser = etree.HTMLPullParser(events=("start", "end"), tag=ARTICLE_BODY_ELEMENT, encoding="utf-8", recover=True, huge_tree=True)
+    article = None
+    for position in range(_parse_from(body), len(body), chunk_size):
+        parser.feed(body[position:position + chunk_size].replace(b"\x00", b""))
+        for event, element in parser.read_events():
+            if article is None:
+                if event == "start" and _is_article_body(element):
+                    article = element
+                    if start_only:
+                        return article
+                elif event == "end":
+                    element.clear()
+            elif event == "end" and element is article:
+                return article
+    parser.close() # a page cut off inside the body (StopDownload) keeps what arrived
+    return article
+
+
+def _utf8_body(response):
+    if codecs.lookup(response.encoding).name == "utf-8":
+        return response.body
+    return response.text.encode("utf-8") # decoded the way Scrapy does (BOM, headers, <meta>)
+
+
+def article_body(response, spider=None):
+    # response.css(ARTICLE_BODY_CSS) without the DOM of the whole page: first article body only, as stored in snapshots.
+    # Cached per response, SnapshotMiddleware and the spider share it. Timed as the "selector" stage
+    article = _bodies.get(response)
+    if article is None:
+        started = time.perf_counter()
+        root = extract_article_body(_utf8_body(response))
+        article = SelectorList([Selector(root=root, type="html")] if root is not None else [])
+        _bodies[response] = article
+        if spider is not None:
+            record(spider, "selector", time.perf_counter() - started)
+    return article
+
+
+def has_article_body(response):
+    # Parsing stops at the article body's opening tag
+    return extract_article_body(_utf8_body(response), start_only=True) is not None
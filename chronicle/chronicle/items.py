@@ -7,6 +7,14 @@ import scrapy
 
 
 class ChronicleItem(scrapy.Item):
-    # define the fields for your item here like:
-    # name = scrapy.Field()
-    pass
+    # article url found by a discovery spider, streamed to the spider's output_file by ChroniclePipeline
+    url = scrapy.Field()
+
+
+class ArticleItem(scrapy.Item):
+    # tested article of one url: validated by ValidationPipeline in worker processes, or already in ArticleSpider.parse.
+    # Its reports are written to the report store by ReportStorePipeline
+    url = scrapy.Field()
+    article = scrapy.Field() # html of div.RichTextArticleBody-body.RichTextBody, None once tested
+    reports = scrapy.Field() # {(offset, frequency): report}
+    digest = scrapy.Field() # of the article body the reports are for, see chronicle.ledger
@@ -0,0 +1,70 @@
+import sqlite3
+import time
+
+
+class TestLedger:
+    """(URL, OFFSET, FREQUENCY, CONTENT DIGEST) -> RESULT OF EVERY FINISHED TEST OF A JOB. WRITTEN IN SMALL BATCHES, READ ON RESUME."""
+
+    def __init__(self, path, batch_size=20):
+        self.path = path
+        self.batch_size = batch_size
+        self.rows = []
+        self.buffered = {} # url -> {(offset, frequency): digest} of self.rows, visible before they are flushed
+        self.written = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS ledger (
+                url TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                frequency INTEGER NOT NULL,
+                digest TEXT,
+                status INTEGER NOT NULL,
+                failure_kind TEXT,
+                tested_at INTEGER NOT NULL,
+                PRIMARY KEY (url, offset, frequency)
+            );
+            """
+        )
+        self.resumed = self.connection.execute("SELECT EXISTS (SELECT 1 FROM ledger)").fetchone()[0] == 1
+
+    def done(self, url, pairs, digest=None):
+        # True if every (offset, frequency) of pairs was tested on content with this digest.
+        # None: the current content is unknown (e.g. snapshot index of a crashed run), the tested one is the latest seen
+        tested = {
+            (offset, frequency)
+            for offset, frequency, row_digest in self.connection.execute(
+                "SELECT offset, frequency, digest FROM ledger WHERE url = ?", (url,)
+            )
+            if digest is None or row_digest == digest
+        }
+        tested.update(pair for pair, pair_digest in self.buffered.get(url, {}).items() if digest is None or pair_digest == digest)
+        return tested >= set(pairs)
+
+    def add(self, url, offset, frequency, digest, report, failure_kind=None):
+        self.rows.append((url, offset, frequency, digest, int(bool(report.get('status'))), failure_kind, int(time.time())))
+        self.buffered.setdefault(url, {})[(offset, frequency)] = digest
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO ledger (url, offset, frequency, digest, status, failure_kind, tested_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self.rows,
+            )
+        self.written += len(self.rows)
+        self.rows = []
+        self.buffered = {}
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM ledger").fetchone()[0] + len(self.rows)
+
+    def close(self):
+        self.flush()
+        self.connection.close()
@@ -1,11 +1,118 @@
+import gzip
 import logging
+import os
+import queue
+import shutil
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
 
 class LogFilter(logging.Filter):
-    def __init__(self, spider_logs_only):
+    """WITH spider_logs_only, LETS THROUGH RECORDS OF THE SPIDERS AND chronicle (AND ERRORS OF ANY LOGGER).
+    THE PREFIX MATCH RUNS ONCE PER LOGGER NAME, RECORDS ONLY LOOK THE NAME UP."""
+    def __init__(self, spider_logs_only, prefixes=("article", "chronicle")):
         self.spider_logs_only = spider_logs_only
+        self.prefixes = tuple(prefixes)
+        self.allowed = {} # logger name -> bool
         super().__init__()
 
     def filter(self, record):
-        if self.spider_logs_only:
-            return record.name.startswith("article") or record.name.startswith("chronicle")
-        return True
\ No newline at end of file
+        if not self.spider_logs_only or record.levelno >= logging.ERROR:
+            return True
+        allowed = self.allowed.get(record.name)
+        if allowed is None:
+            allowed = self.allowed[record.name] = record.name.startswith(self.prefixes)
+        return allowed
+
+
+def gzip_rotator(source, dest):
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def rotating_handler(handler, max_bytes, backup_count, compress):
+    # RotatingFileHandler writing to the same file as Scrapy's FileHandler, with its level, formatter and filters
+    rotating = RotatingFileHandler(handler.baseFilename, mode=handler.mode, maxBytes=max_bytes,
+                                   backupCount=backup_count, encoding=handler.encoding)
+    rotating.setLevel(handler.level)
+    rotating.setFormatter(handler.formatter)
+    for log_filter in handler.filters:
+        rotating.addFilter(log_filter)
+    if compress:
+        rotating.namer = lambda name: f"{name}.gz"
+        rotating.rotator = gzip_rotator
+    return rotating
+
+
+class QueueLogging:
+    """NON-BLOCKING LOG OUTPUT. THE ROOT LOGGER ONLY PUTS RECORDS ON A QUEUE, A LISTENER THREAD WRITES THEM WITH THE ORIGINAL HANDLER."""
+    def __init__(self, handler, log_filter=None, max_bytes=0, backup_count=5, compress=False):
+        self.handler = handler
+        self.queue = queue.SimpleQueue()
+        self.queue_handler = QueueHandler(self.queue)
+        self.queue_handler.setLevel(handler.level) # records below LOG_LEVEL are not even queued
+        if log_filter:
+            self.queue_handler.addFilter(log_filter)
+        if max_bytes and isinstance(handler, logging.FileHandler):
+            self.output = rotating_handler(handler, max_bytes, backup_count, compress)
+        else:
+            self.output = handler
+        self.listener = QueueListener(self.queue, self.output, respect_handler_level=True)
+        self.started = False
+
+    def start(self):
+        root = logging.getLogger()
+        root.removeHandler(self.handler)
+        if self.output is not self.handler:
+            self.handler.close()
+        root.addHandler(self.queue_handler)
+        self.listener.start()
+        self.started = True
+
+    # Writes what is left in the queue and puts the output handler back on the root logger
+    def stop(self):
+        if not self.started:
+            return
+        self.started = False
+        root = logging.getLogger()
+        root.removeHandler(self.queue_handler)
+        self.listener.stop()
+        root.addHandler(self.output)
+
+
+class ForwardHandler(logging.Handler):
+    """HANDS RECORDS OF WORKER PROCESSES TO THE LOGGER OF THE SAME NAME IN THIS PROCESS: ITS LEVEL, FILTERS AND HANDLERS APPLY."""
+    def emit(self, record):
+        logger = logging.getLogger(record.name)
+        if logger.isEnabledFor(record.levelno):
+            logger.handle(record)
+
+
+def worker_logging(log_queue, level):
+    # Initializer of worker processes: records at level and above go to log_queue, nothing is written in the worker
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
+
+
+class WorkerLogging:
+    """LOGS OF A PROCESS POOL. WORKERS PUT RECORDS ON A multiprocessing QUEUE, A LISTENER THREAD LOGS THEM IN THIS PROCESS."""
+    def __init__(self, context, level):
+        self.level = level
+        self.queue = context.Queue()
+        self.listener = QueueListener(self.queue, ForwardHandler())
+
+    def initializer(self):
+        # initializer and initargs of the pool
+        return worker_logging, (self.queue, self.level)
+
+    def start(self):
+        self.listener.start()
+
+    # After the pool is shut down: logs what the workers left in the queue
+    def stop(self):
+        self.listener.stop()
+        self.queue.close()
+        self.queue.join_thread()
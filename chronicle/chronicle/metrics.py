@@ -0,0 +1,145 @@
+import json
+import os
+import time
+from bisect import bisect_left
+
+# Upper bounds (seconds) of the histogram buckets: 10us to ~110s, each 1.5x the previous one
+BUCKET_BOUNDS = tuple(1e-5 * 1.5 ** i for i in range(41))
+
+
+class Histogram:
+    """DURATIONS IN FIXED LOG-SCALE BUCKETS. CONSTANT MEMORY, MERGEABLE ACROSS PROCESSES, PERCENTILES WITHIN ONE BUCKET (1.5x)."""
+    __slots__ = ('counts', 'count', 'total')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1) # last one is above the highest bound
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.total += other.total
+
+    def percentile(self, q):
+        # upper bound of the bucket the q-th percentile falls in
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else float('inf')
+        return float('inf')
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count * 1000, 3) if self.count else None,
+            'p50_ms': _ms(self.percentile(50)),
+            'p95_ms': _ms(self.percentile(95)),
+            'p99_ms': _ms(self.percentile(99)),
+        }
+
+    def to_dict(self):
+        return {'counts': self.counts, 'count': self.count, 'total': self.total}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        histogram.counts = list(data['counts'])
+        histogram.count = data['count']
+        histogram.total = data['total']
+        return histogram
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+class StageMetrics:
+    """PER-STAGE DURATION HISTOGRAMS AND COUNTERS OF ONE CRAWL. DUMPED AS JSON, OR IN PROMETHEUS TEXT FORMAT."""
+
+    def __init__(self):
+        self.stages = {} # stage -> Histogram
+        self.counters = {} # name -> int
+        self.started = time.time()
+
+    def record(self, stage, seconds):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = Histogram()
+        histogram.record(seconds)
+
+    def inc(self, name, count=1):
+        self.counters[name] = self.counters.get(name, 0) + count
+
+    def merge(self, other):
+        for stage, histogram in other.stages.items():
+            self.stages.setdefault(stage, Histogram()).merge(histogram)
+        for name, count in other.counters.items():
+            self.inc(name, count)
+        self.started = min(self.started, other.started)
+
+    def articles_per_second(self, now=None):
+        elapsed = (now or time.time()) - self.started
+        return round(self.counters.get('articles', 0) / elapsed, 3) if elapsed > 0 else None
+
+    def to_dict(self):
+        return {
+            'started': self.started,
+            'articles_per_second': self.articles_per_second(),
+            'counters': dict(self.counters),
+            'stages': {stage: {**histogram.summary(), **histogram.to_dict()} for stage, histogram in self.stages.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        metrics = cls()
+        metrics.started = data.get('started', metrics.started)
+        metrics.counters = dict(data.get('counters', {}))
+        metrics.stages = {stage: Histogram.from_dict(histogram) for stage, histogram in data.get('stages', {}).items()}
+        return metrics
+
+    def to_prometheus(self, prefix='chronicle'):
+        lines = [
+            f'# HELP {prefix}_stage_seconds Duration of a crawl stage.',
+            f'# TYPE {prefix}_stage_seconds histogram',
+        ]
+        for stage, histogram in sorted(self.stages.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKET_BOUNDS, histogram.counts):
+                cumulative += count
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound:.6g}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {histogram.total:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        lines.append(f'# TYPE {prefix}_events_total counter')
+        for name, count in sorted(self.counters.items()):
+            lines.append(f'{prefix}_events_total{{event="{name}"}} {count}')
+        lines.append(f'# TYPE {prefix}_articles_per_second gauge')
+        lines.append(f'{prefix}_articles_per_second {self.articles_per_second() or 0}')
+        return "\n".join(lines) + "\n"
+
+    def save(self, path, prometheus=False):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            if prometheus:
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp_path, path)
+
+
+def record(spider, stage, seconds):
+    # no-op unless the StageTimings extension is on
+    metrics = getattr(spider, 'stage_metrics', None)
+    if metrics is not None:
+        metrics.record(stage, seconds)
@@ -1,6 +1,8 @@
 import scrapy
-import time
-from scrapy.exceptions import CloseSpider
+from scrapy.exceptions import CloseSpider, IgnoreRequest, NotConfigured
+from scrapy.http import HtmlResponse
+from scrapy.utils.httpobj import urlparse_cached
+from http.cookies import SimpleCookie, CookieError
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
@@ -8,9 +10,19 @@ from selenium import webdriver
 from selenium.webdriver.chrome.service import Service as ChromeService
 from webdriver_manager.chrome import ChromeDriverManager
 from scrapy import signals
-from chronicle.logger import LogFilter
+from twisted.internet.defer import Deferred
+from twisted.internet.threads import deferToThread
+from scrapy.utils.log import get_scrapy_root_handler
+from chronicle.logger import LogFilter, QueueLogging
+from chronicle.extract import article_body
+from chronicle.metrics import record
+from chronicle.snapshots import SnapshotStore
+from chronicle.session import SessionCache
+from urllib.parse import urljoin, urlparse
+import atexit
 import logging
 import os 
+import time
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -18,25 +30,163 @@ load_dotenv()
 # Note: all credentials must be stored in .env file (environment variables), same level as this file
 # Otherwise, your credentials will be exposed in the codebase
 class LoggingMiddleware:
+    # Enabled as spider and downloader middleware, the logging setup runs for the first instance only
+    def __init__(self, backend=None):
+        self.backend = backend
+
     @classmethod
     def from_crawler(cls, crawler):
-        instance = cls()
-        is_disabled = crawler.settings.getbool('DEFAULT_LOGS_DISABLED', True)
-        log_filter = LogFilter(is_disabled)
+        settings = crawler.settings
+        root = logging.getLogger()
+        # Scrapy leaves the root logger at NOTSET and drops records in its handler, so every logger.info() call builds
+        # a record. With the root at LOG_LEVEL, isEnabledFor() is accurate and CleanData/RunTests traces are skipped
+        root.setLevel(settings.get('LOG_LEVEL'))
+
+        handler = get_scrapy_root_handler()
+        if handler is None or handler not in root.handlers or any(isinstance(f, LogFilter) for f in handler.filters):
+            return cls() # no Scrapy log output, or already set up
+        log_filter = LogFilter(settings.getbool('DEFAULT_LOGS_DISABLED', True))
+
+        backend = None
+        if settings.getbool('LOG_QUEUE', True):
+            backend = QueueLogging(
+                handler,
+                log_filter,
+                max_bytes=settings.getint('LOG_MAX_BYTES', 0),
+                backup_count=settings.getint('LOG_BACKUP_COUNT', 5),
+                compress=settings.getbool('LOG_COMPRESS', False),
+            )
+            backend.start()
+            crawler.signals.connect(backend.stop, signal=scrapy.signals.engine_stopped)
+            atexit.register(backend.stop) # queued records of a crashed run
+        else:
+            handler.addFilter(log_filter)
 
-        logging.getLogger().addFilter(log_filter)
+        instance = cls(backend)
         crawler.signals.connect(instance.spider_opened, signal=scrapy.signals.spider_opened)
         return instance
 
     def spider_opened(self, spider):
-        spider.logger.info("Logging filter applied")
+        spider.logger.info(f"Logging filter applied{', writing through a queue' if self.backend else ''}")
+
+
+# Stores article bodies of spiders with use_snapshots = True and serves them back in OFFLINE mode.
+# Runs before LoginMiddleware, so offline runs never launch the browser.
+class SnapshotMiddleware:
+    def __init__(self, store, offline):
+        self.store = store
+        self.offline = offline
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('SNAPSHOTS_ENABLED', False):
+            raise NotConfigured
+        store = SnapshotStore(crawler.settings.get('SNAPSHOT_DIR', 'snapshots'))
+        instance = cls(store, crawler.settings.getbool('OFFLINE', False))
+        crawler.signals.connect(instance.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(instance.spider_closed, signal=signals.spider_closed)
+        return instance
+
+    def spider_opened(self, spider):
+        if getattr(spider, 'use_snapshots', False):
+            spider.snapshot_store = self.store # digests of stored bodies, for the test ledger
+
+    def _snapshot_response(self, request, url):
+        fragment = self.store.get(url)
+        if fragment is None:
+            return None
+        return HtmlResponse(url=request.url, body=fragment, encoding='utf-8', request=request, flags=['snapshot'])
+
+    def process_request(self, request, spider):
+        if not getattr(spider, 'use_snapshots', False):
+            return None
 
+        if self.offline:
+            response = self._snapshot_response(request, request.url)
+            if response is None:
+                spider.logger.error(f"No snapshot stored for {request.url}")
+                raise IgnoreRequest(f"No snapshot stored for {request.url}")
+            return response
+
+        # Revalidate stored snapshots, a 304 is answered from disk in process_response
+        etag, last_modified = self.store.validators(request.url)
+        if etag:
+            request.headers.setdefault('If-None-Match', etag)
+        if last_modified:
+            request.headers.setdefault('If-Modified-Since', last_modified)
+        return None
+
+    def process_response(self, request, response, spider):
+        if not getattr(spider, 'use_snapshots', False) or 'snapshot' in response.flags:
+            return response
+
+        url = request.meta.get('redirect_urls', [request.url])[0]
+        if response.status == 304:
+            snapshot = self._snapshot_response(request, url)
+            return snapshot if snapshot is not None else response
+
+        if response.status == 200 and isinstance(response, HtmlResponse):
+            fragment = article_body(response, spider).get() # extracted once per response, the spider reuses it
+            if fragment:
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+                self.store.put(
+                    url,
+                    fragment,
+                    etag=etag.decode('latin-1') if etag else None,
+                    last_modified=last_modified.decode('latin-1') if last_modified else None,
+                )
+        return response
+
+    def spider_closed(self, spider):
+        self.store.save()
+        spider.logger.info(f"{len(self.store)} snapshots stored in {self.store.path}")
 
+
+# Logs in once, in a thread: the reactor keeps running and requests that arrive meanwhile wait on the same login.
+# A 401 or a redirect to the sign in page later in the crawl logs in again and retries the request.
 class LoginMiddleware:
-    def __init__(self):
+    def __init__(self, crawler=None, session=None, login_timeout=10, sign_in_patterns=(), max_relogins=2,
+                 base_url="https://qa.brightspot.chronicle.com"):
+        self.crawler = crawler
+        self.base_url = base_url.rstrip('/')
         self.logged_in = False
         self.cookies = {}
         self.driver = None
+        self.session = session
+        self.login_timeout = login_timeout
+        self.sign_in_patterns = sign_in_patterns
+        self.max_relogins = max_relogins
+        self.generation = 0 # bumped on every login, requests remember which session they were sent with
+        self.pending = None # Deferreds of requests waiting for the login in progress
+        self.cookie_headers = {} # host -> serialized Cookie header of the session, built once per host
+        self.login_started = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls.from_settings(crawler.settings, crawler)
+
+    @classmethod
+    def from_settings(cls, settings, crawler=None):
+        # Without a crawler too: chronicle.runner logs in once before starting its shards
+        base_url = settings.get('BASE_URL', 'https://qa.brightspot.chronicle.com').rstrip('/')
+        session = None
+        if settings.get('SESSION_FILE'):
+            probe_url = settings.get('SESSION_PROBE_URL')
+            session = SessionCache(
+                settings.get('SESSION_FILE'),
+                max_age=settings.getint('SESSION_MAX_AGE', 12 * 3600),
+                probe_url=urljoin(f"{base_url}/", probe_url) if probe_url else None,
+                probe_marker=settings.get('SESSION_PROBE_MARKER'),
+            )
+        return cls(
+            crawler=crawler,
+            session=session,
+            login_timeout=settings.getint('LOGIN_TIMEOUT', 10),
+            sign_in_patterns=settings.getlist('SIGN_IN_URL_PATTERNS'),
+            max_relogins=settings.getint('MAX_RELOGINS', 2),
+            base_url=base_url,
+        )
 
     def start_driver(self):
         if not self.driver:
@@ -49,32 +199,170 @@ class LoginMiddleware:
 
     def process_request(self, request, spider):
         if self.logged_in:
-            request.cookies = {cookie['name']: cookie['value'] for cookie in self.cookies}
+            started = time.perf_counter()
+            parked_at = request.meta.pop('login_parked_at', None)
+            if parked_at is not None:
+                record(spider, 'login_wait', started - parked_at)
+            # Session cookies go in as a ready header, CookiesMiddleware doesn't merge them again for every request.
+            # Set-Cookie of these responses is handled in process_response instead
+            header = self.cookie_header(urlparse_cached(request).hostname)
+            if header:
+                request.headers[b'Cookie'] = header
+                request.meta['dont_merge_cookies'] = True
+            request.meta['login_generation'] = self.generation
+            record(spider, 'login_middleware', time.perf_counter() - started)
             return None
 
-        if not self.logged_in:
-            self.start_driver()
+        # Park the request until the login is done, then come back here for the cookies
+        request.meta['login_parked_at'] = time.perf_counter()
+        waiter = Deferred()
+        waiter.addCallback(lambda _: self.process_request(request, spider))
+        if self.pending is None:
+            self.pending = [waiter]
+            self.login_started = time.perf_counter()
             spider.logger.info("Starting login")
+            login = deferToThread(self.login, spider)
+            login.addCallbacks(self.login_done, self.login_failed, callbackArgs=(spider,), errbackArgs=(spider,))
+        else:
+            self.pending.append(waiter)
+        return waiter
+
+    def cookie_header(self, host):
+        header = self.cookie_headers.get(host)
+        if header is None:
+            pairs = [f"{cookie['name']}={cookie['value']}" for cookie in self.cookies if self._domain_match(cookie, host)]
+            header = self.cookie_headers[host] = "; ".join(pairs).encode('utf-8')
+        return header
+
+    @staticmethod
+    def _domain_match(cookie, host):
+        domain = (cookie.get('domain') or '').lstrip('.')
+        return not domain or host == domain or host.endswith(f".{domain}")
+
+    def set_cookies(self, cookies):
+        # Refresh hook: installs a new cookie list for the session and drops the prebuilt headers
+        self.cookies = cookies
+        self.cookie_headers = {}
+
+    def refresh(self, spider):
+        # Refresh hook: the next request logs in again (cached session is dropped too)
+        spider.logger.info("Session refresh requested")
+        self.logged_in = False
+        if self.session:
+            self.session.clear()
+
+    def update_cookies(self, response):
+        # Cookies the site sets or deletes on the way, CookiesMiddleware doesn't see them with dont_merge_cookies
+        cookies = {cookie['name']: cookie for cookie in self.cookies}
+        changed = False
+        for header in response.headers.getlist('Set-Cookie'):
+            parsed = SimpleCookie()
             try:
-                self.login_user(spider)
-            except Exception as e:
-                spider.logger.critical(f"Login failed: {e}")
-                raise CloseSpider("LOGIN FAILED")
-            finally:
-                self.stop_driver()
-        return None
+                parsed.load(header.decode('latin-1'))
+            except CookieError:
+                continue
+            for name, morsel in parsed.items():
+                domain = morsel['domain'] or cookies.get(name, {}).get('domain') or urlparse_cached(response).hostname
+                if not morsel.value or morsel['max-age'] == '0' or morsel['max-age'].startswith('-'):
+                    changed = cookies.pop(name, None) is not None or changed
+                elif name not in cookies or cookies[name]['value'] != morsel.value:
+                    cookies[name] = {**cookies.get(name, {}), 'name': name, 'value': morsel.value, 'domain': domain}
+                    changed = True
+        if changed:
+            self.set_cookies(list(cookies.values()))
+            if self.session:
+                self.session.save(self.cookies)
+
+    def process_response(self, request, response, spider):
+        if self.logged_in and b'Set-Cookie' in response.headers and request.meta.get('login_generation') == self.generation:
+            self.update_cookies(response)
+
+        if not self.is_signed_out(response):
+            return response
+
+        relogins = request.meta.get('relogin_times', 0)
+        if relogins >= self.max_relogins:
+            spider.logger.error(f"Still signed out after {relogins} logins: {request.url}")
+            return response
+
+        # Only the first response of an expired session triggers the login, the others just retry
+        if self.logged_in and request.meta.get('login_generation') == self.generation:
+            spider.logger.warning(f"Session expired at {request.url}, logging in again")
+            self.refresh(spider)
+
+        url = request.meta.get('redirect_urls', [request.url])[0]
+        meta = {key: value for key, value in request.meta.items() if not key.startswith('redirect_')}
+        meta['relogin_times'] = relogins + 1
+        return request.replace(url=url, meta=meta, dont_filter=True)
+
+    def is_signed_out(self, response):
+        if response.status == 401:
+            return True
+        if 300 <= response.status < 400:
+            target = response.headers.get('Location', b'').decode('latin-1')
+        else:
+            target = response.url
+        # the path only, the pattern whole or followed by '/': /u/login?state=... signs in, /article/login-tips doesn't
+        path = urlparse(target).path.rstrip('/')
+        return any(
+            path == pattern.rstrip('/') or path.startswith(pattern.rstrip('/') + '/') for pattern in self.sign_in_patterns
+        )
+
+    def login(self, spider):
+        # Runs in a thread, blocking is fine here
+        if self.load_session(spider):
+            return
+        self.start_driver()
+        try:
+            self.login_user(spider)
+        finally:
+            self.stop_driver()
+        if self.session:
+            self.session.save(self.cookies)
+
+    def login_done(self, _, spider):
+        record(spider, 'login', time.perf_counter() - self.login_started)
+        self.set_cookies(self.cookies)
+        self.logged_in = True
+        self.generation += 1
+        waiters, self.pending = self.pending, None
+        for waiter in waiters:
+            waiter.callback(None)
+
+    def login_failed(self, failure, spider):
+        spider.logger.critical(f"Login failed: {failure.value}")
+        waiters, self.pending = self.pending, None
+        for waiter in waiters:
+            waiter.errback(IgnoreRequest("LOGIN FAILED"))
+        if self.crawler and self.crawler.engine:
+            self.crawler.engine.close_spider(spider, "login_failed")
+
+    def load_session(self, spider):
+        # Cookies from the previous run, if they are fresh and the site still accepts them
+        if not self.session:
+            return False
+        cookies = self.session.load()
+        if not cookies:
+            spider.logger.info("No fresh cached session, logging in with browser")
+            return False
+        if not self.session.probe(cookies):
+            spider.logger.info("Cached session rejected by the site, logging in with browser")
+            self.session.clear()
+            return False
+        spider.logger.info("Cached session reused")
+        self.cookies = cookies
+        return True
 
     def login_user(self, spider):
-        self.driver.get("https://qa.brightspot.chronicle.com/")
-        wait = WebDriverWait(self.driver, 10)
+        self.driver.get(f"{self.base_url}/")
+        wait = WebDriverWait(self.driver, self.login_timeout)
 
         sign_in_button = wait.until(EC.element_to_be_clickable((By.XPATH, "//a[text()='Sign In']")))
         sign_in_button.click()
-        
-        time.sleep(2) # CRUCIAL: Wait for the login modal to appear
 
-        email_input = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="1-email"]')))
-        password_input = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="1-password"]')))
+        # CRUCIAL: Wait for the login modal to appear, polls instead of a fixed sleep
+        email_input = wait.until(EC.visibility_of_element_located((By.XPATH, '//*[@id="1-email"]')))
+        password_input = wait.until(EC.visibility_of_element_located((By.XPATH, '//*[@id="1-password"]')))
         submit_button = wait.until(EC.element_to_be_clickable((By.XPATH, '//*[@id="1-submit"]')))
 
         email_input.clear()
@@ -92,7 +380,6 @@ class LoginMiddleware:
         ) # Just like in ROBOT
         if user_menu:
             spider.logger.info("Login successful")
-            self.logged_in = True
             self.cookies = self.driver.get_cookies()
         else:
             raise CloseSpider("Login failed")
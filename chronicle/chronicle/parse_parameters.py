@@ -1,3 +1,5 @@
+BASE_URL = "https://qa.brightspot.chronicle.com" # site under test, benchmarks/fixture_server.py for a local one
+
 FREQUENCY = 3
 OFFSET = 3
 
@@ -5,6 +7,11 @@ MAX_PAGES_TO_LOAD = 100
 
 SEARCH = True
 LATEST = False
+SITEMAP = False # True (with SEARCH and LATEST False): 'article' spider tests the urls found by 'article-sitemap'
+SITEMAP_SINCE = None # "2024-01-01": 'article-sitemap' keeps only urls modified since that day (lastmod), None: all
+
+INCREMENTAL = False # True: discovery spiders remember checked urls in URL_INDEX and stop at the first page without new ones
+URL_INDEX = "urls.db"
 
 VERBOSE = False
 
@@ -15,5 +22,13 @@ ARTICLES = {
     }
 }
 
+TEST_CONFIG = None # "test_config.csv" (kind,rule,offset,frequency) or a .db of rules per url, pattern or section, see chronicle.test_config
+
 BULK_TEST = False
+TRACE_FAILURES = True # with VERBOSE off: log the last TRACE_LINES steps of cleaning/testing for articles that fail
+TRACE_LINES = 100
+VALIDATION_WORKERS = 0 # >0: ad tests run in that many worker processes while the crawl goes on, 0: inline in the spider
+
+OFFLINE = False # True: 'article' spider tests stored snapshots only, nothing is downloaded (run it online once first)
+SNAPSHOT_DIR = "snapshots"
 DEFAULT_LOGS_DISABLED = True
\ No newline at end of file
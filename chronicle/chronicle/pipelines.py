@@ -6,8 +6,179 @@
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
+from scrapy.exceptions import DropItem, NotConfigured
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import asyncio
+import os
+from chronicle.items import ArticleItem, ChronicleItem
+from chronicle.ledger import TestLedger
+from chronicle.logger import WorkerLogging
+from chronicle.parse_parameters import INCREMENTAL
+from chronicle.report_store import ReportStore, job_run_id
+from chronicle.sink import JsonLinesSink, read_urls
+from chronicle.utils import failure_kind, get_test_parameters, log_report, log_trace, run_tests_in_worker
 
 
+# Streams urls from the discovery spiders to their output_file (JSON Lines) in batches, nothing is kept in memory.
+# INCREMENTAL runs append to the file, full runs start it over.
 class ChroniclePipeline:
+    def __init__(self, batch_size, incremental):
+        self.batch_size = batch_size
+        self.incremental = incremental
+        self.sink = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings.getint('DISCOVERY_BATCH_SIZE', 100), INCREMENTAL)
+
+    def open_spider(self, spider):
+        output_file = getattr(spider, 'output_file', None)
+        if output_file:
+            # first incremental run: carry over the urls of the old .json output
+            seed = list(read_urls(output_file)) if self.incremental and not os.path.exists(output_file) else []
+            self.sink = JsonLinesSink(output_file, batch_size=self.batch_size, append=self.incremental)
+            for url in seed:
+                self.sink.write({'url': url})
+
+    def close_spider(self, spider):
+        if self.sink:
+            self.sink.close()
+            spider.logger.info(f"Saved {self.sink.written} articles to {self.sink.path}")
+
+    def process_item(self, item, spider):
+        if self.sink and isinstance(item, ChronicleItem):
+            self.sink.write({'url': ItemAdapter(item)['url']})
+        return item
+
+
+# CleanData/RunTests of ArticleSpider in a process pool, so validation of long articles (BULK_TEST especially)
+# doesn't freeze the reactor and downloads keep going. Enabled with VALIDATION_WORKERS > 0.
+# Workers log at LOG_LEVEL through a queue, their records are written by this process as the spider's are.
+class ValidationPipeline:
+    def __init__(self, workers, log_level='WARNING'):
+        self.workers = workers
+        self.log_level = log_level
+        self.executor = None
+        self.logging = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        workers = crawler.settings.getint('VALIDATION_WORKERS', 0)
+        if workers <= 0:
+            raise NotConfigured
+        return cls(workers, crawler.settings.get('LOG_LEVEL'))
+
+    def open_spider(self, spider):
+        # spawn: forking a process that runs the reactor and its threads is not safe
+        context = multiprocessing.get_context('spawn')
+        # VERBOSE output and traces of CleanData/RunTests in the workers are logged here, at LOG_LEVEL
+        self.logging = WorkerLogging(context, self.log_level)
+        self.logging.start()
+        initializer, initargs = self.logging.initializer()
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=context, initializer=initializer, initargs=initargs,
+        )
+        spider.logger.info(f"Validation pool started with {self.workers} workers")
+
+    def close_spider(self, spider):
+        self.executor.shutdown(wait=True)
+        self.logging.stop()
+
+    async def process_item(self, item, spider):
+        if not isinstance(item, ArticleItem):
+            return item
+
+        adapter = ItemAdapter(item)
+        url = adapter['url']
+        try:
+            offset, frequency = get_test_parameters(spider, url)
+            spider.logger.info(f"TESTING URL: {url}, offset: {offset}, frequency: {frequency}")
+            future = self.executor.submit(run_tests_in_worker, spider.name, adapter['article'], offset, frequency)
+            results = await asyncio.wrap_future(future)
+        except Exception as e:
+            spider.logger.critical(f"UNEXPECTED ERROR: {e}")
+            raise DropItem(f"Validation failed for {url}: {e}")
+
+        for (off, freq), report in results.items():
+            log_report(spider, url, off, freq, report)
+        log_trace(spider, url, results)
+        adapter['reports'] = results
+        adapter['article'] = None # html is not needed anymore
+        return item
+
+
+# Records every finished test of a JOBDIR job in <JOBDIR>/ledger.db with the digest of the article body it ran on.
+# A resumed job (same JOBDIR) skips urls whose stored body was already tested, see ArticleSpider.
+# Without JOBDIR or with TEST_LEDGER_ENABLED = False there is no ledger.
+# Runs after ReportStorePipeline, which then flushes as often: a test is in the ledger only once its reports are stored.
+class TestLedgerPipeline:
+    def __init__(self, path, batch_size):
+        self.path = path
+        self.batch_size = batch_size
+        self.ledger = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        jobdir = settings.get('JOBDIR')
+        if not jobdir or not settings.getbool('TEST_LEDGER_ENABLED', True):
+            raise NotConfigured
+        os.makedirs(jobdir, exist_ok=True)
+        return cls(os.path.join(jobdir, 'ledger.db'), settings.getint('TEST_LEDGER_BATCH_SIZE', 20))
+
+    def open_spider(self, spider):
+        self.ledger = TestLedger(self.path, batch_size=self.batch_size)
+        spider.ledger = self.ledger # read by ArticleSpider
+        if self.ledger.resumed:
+            spider.logger.warning(f"Resuming job: {len(self.ledger)} tests already in {self.path}")
+            spider.crawler.stats.set_value("test_ledger/resumed_with", len(self.ledger))
+
+    def close_spider(self, spider):
+        self.ledger.close()
+        spider.logger.info(f"{self.ledger.written} tests added to {self.path}")
+
+    def process_item(self, item, spider):
+        if isinstance(item, ArticleItem):
+            adapter = ItemAdapter(item)
+            for (offset, frequency), report in (adapter.get('reports') or {}).items():
+                self.ledger.add(adapter['url'], offset, frequency, adapter.get('digest'), report, failure_kind(report))
+        return item
+
+
+# Writes every report of a tested ArticleItem to REPORT_STORE (SQLite): url, offset, frequency, status, failure kind,
+# details and the tag codes the tests ran on. Query it instead of grepping the log. Disabled with REPORT_STORE = None.
+class ReportStorePipeline:
+    def __init__(self, path, batch_size, run_id=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.run_id = run_id
+        self.store = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        path = settings.get('REPORT_STORE')
+        if not path:
+            raise NotConfigured
+        batch_size = settings.getint('REPORT_BATCH_SIZE', 500)
+        run_id = settings.get('REPORT_RUN_ID')
+        if settings.get('JOBDIR'):
+            run_id = run_id or job_run_id(settings.get('JOBDIR')) # a resumed job goes on with its run
+            if settings.getbool('TEST_LEDGER_ENABLED', True):
+                batch_size = min(batch_size, settings.getint('TEST_LEDGER_BATCH_SIZE', 20))
+        return cls(path, batch_size, run_id)
+
+    def open_spider(self, spider):
+        self.store = ReportStore(self.path, batch_size=self.batch_size, run_id=self.run_id)
+
+    def close_spider(self, spider):
+        self.store.close()
+        spider.logger.info(f"Saved {self.store.written} test reports to {self.path} (run {self.store.run_id})")
+
     def process_item(self, item, spider):
+        if isinstance(item, ArticleItem):
+            adapter = ItemAdapter(item)
+            for (offset, frequency), report in (adapter.get('reports') or {}).items():
+                self.store.add(adapter['url'], offset, frequency, report, failure_kind(report))
         return item
@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import time
+
+COLUMNS = "run_id, url, offset, frequency, status, soft, failure_kind, details, tokens, tested_at"
+
+
+def job_run_id(jobdir):
+    # run_id of a JOBDIR job is kept in it, a resumed job adds to the same run
+    path = os.path.join(jobdir, "run_id")
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    run_id = time.strftime("%Y-%m-%dT%H:%M:%S")
+    os.makedirs(jobdir, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(run_id)
+    return run_id
+
+
+class ReportStore:
+    """TEST REPORTS IN SQLITE, ONE ROW PER (URL, OFFSET, FREQUENCY) OF EVERY RUN. ROWS ARE INSERTED IN BATCHES."""
+
+    def __init__(self, path, batch_size=500, run_id=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.run_id = run_id or time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.rows = []
+        self.written = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS reports (
+                id INTEGER PRIMARY KEY,
+                run_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                frequency INTEGER NOT NULL,
+                status INTEGER NOT NULL,
+                soft INTEGER NOT NULL,
+                failure_kind TEXT,
+                details TEXT,
+                tokens BLOB,
+                tested_at INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS reports_url ON reports (url, offset, frequency);
+            CREATE INDEX IF NOT EXISTS reports_run ON reports (run_id, status, failure_kind);
+            """
+        )
+
+    def add(self, url, offset, frequency, report, failure_kind=None):
+        details = report.get('details') or []
+        self.rows.append((
+            self.run_id,
+            url,
+            offset,
+            frequency,
+            int(bool(report.get('status'))),
+            int(any('[SOFTERROR]' in detail for detail in details)),
+            failure_kind,
+            "\n".join(details) or None,
+            report.get('tokens'),
+            int(time.time()),
+        ))
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT INTO reports ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self.rows,
+            )
+        self.written += len(self.rows)
+        self.rows = []
+
+    def merge(self, path):
+        # Appends the rows of another report store (a shard of chronicle.runner), returns how many
+        self.flush()
+        self.connection.execute("ATTACH DATABASE ? AS shard", (path,))
+        try:
+            with self.connection:
+                cursor = self.connection.execute(
+                    f"INSERT INTO reports ({COLUMNS}) SELECT {COLUMNS} FROM shard.reports"
+                )
+        finally:
+            self.connection.execute("DETACH DATABASE shard")
+        self.written += cursor.rowcount
+        return cursor.rowcount
+
+    def close(self):
+        self.flush()
+        self.connection.close()
@@ -0,0 +1,165 @@
+# Sharded "article" crawl for long url lists: the urls are split across N scrapy processes, each with its own reactor
+# and its own core. The session is obtained once, before the shards start (they reuse it from SESSION_FILE),
+# their reports and stage timings are merged into REPORT_STORE and STAGE_METRICS_FILE when all of them are done.
+#
+# Run from chronicle/ (where scrapy.cfg is), -s settings are passed on to every shard:
+#   python -m chronicle.runner --shards 4 [--by range] [-s BASE_URL=http://127.0.0.1:8080]
+# Shard logs, reports and timings are in --work-dir (shard-<n>.log ...), reports and timings are removed once merged.
+# With -s JOBDIR=... every shard gets JOBDIR/shard-<n>, run the same command (same --shards) again to resume.
+import argparse
+import itertools
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import zlib
+from scrapy.utils.conf import arglist_to_dict
+from scrapy.utils.project import get_project_settings
+
+SHARD_BY = ("hash", "range")
+
+
+def shard_of(url, shards):
+    return zlib.crc32(url.encode("utf-8")) % shards
+
+
+def shard_urls(urls, shard, shards, by="hash", count=None):
+    # hash: a url stays in the same shard whatever the order of the list. range: the n-th contiguous block,
+    # count() gives the urls once more to count them (the list is kept in memory without it)
+    if by == "hash":
+        return (url for url in urls if shard_of(url, shards) == shard)
+    if by == "range":
+        if count is None:
+            urls = list(urls)
+            total = len(urls)
+        else:
+            total = sum(1 for _ in count())
+        return itertools.islice(urls, total * shard // shards, total * (shard + 1) // shards)
+    raise ValueError(f"Unknown shard_by: {by}, use one of {SHARD_BY}")
+
+
+def login_once(settings, logger):
+    # Fresh cached session or a browser login, saved to SESSION_FILE for the shards
+    from chronicle.middlewares import LoginMiddleware
+    from chronicle.utils import WorkerSpider
+
+    middleware = LoginMiddleware.from_settings(settings)
+    if middleware.session is None:
+        raise SystemExit("SESSION_FILE is not set, every shard would log in on its own")
+    logger.info("Logging in before starting the shards")
+    middleware.login(WorkerSpider("runner"))
+
+
+def shard_command(shard, shards, by, paths, run_id, overrides):
+    command = [
+        sys.executable, "-m", "scrapy", "crawl", "article",
+        "-a", f"shard={shard}", "-a", f"shards={shards}", "-a", f"shard_by={by}",
+    ]
+    for name, value in overrides.items():
+        command += ["-s", f"{name}={value}"]
+    # after the user's settings, these have to differ per shard
+    command += [
+        "-s", f"LOG_FILE={paths['log']}",
+        "-s", f"REPORT_STORE={paths['reports'] or ''}",
+        "-s", f"REPORT_RUN_ID={run_id}",
+        "-s", f"STAGE_METRICS_FILE={paths['metrics'] or ''}",
+        "-s", "STAGE_METRICS_PROMETHEUS=", # one merged file at the end, shards would overwrite each other's
+    ]
+    if overrides.get("JOBDIR"):
+        command += ["-s", f"JOBDIR={os.path.join(overrides['JOBDIR'], f'shard-{shard}')}"]
+    return command
+
+
+def merge_reports(path, shard_paths, run_id, logger):
+    from chronicle.report_store import ReportStore
+
+    store = ReportStore(path, run_id=run_id)
+    try:
+        for shard_path in shard_paths:
+            if os.path.exists(shard_path):
+                store.merge(shard_path)
+                os.remove(shard_path)
+    finally:
+        store.close()
+    logger.info(f"Merged {store.written} test reports into {path} (run {run_id})")
+
+
+def merge_metrics(path, prometheus_path, shard_paths, logger):
+    from chronicle.metrics import StageMetrics
+
+    metrics = StageMetrics()
+    for shard_path in shard_paths:
+        if os.path.exists(shard_path):
+            with open(shard_path, "r", encoding="utf-8") as f:
+                metrics.merge(StageMetrics.from_dict(json.load(f)))
+            os.remove(shard_path)
+    if path:
+        metrics.save(path)
+    if prometheus_path:
+        metrics.save(prometheus_path, prometheus=True)
+    logger.info(f"{metrics.counters.get('articles', 0)} articles tested, {metrics.articles_per_second()} articles/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the 'article' spider in several processes over parts of the url list")
+    parser.add_argument("-n", "--shards", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--by", choices=SHARD_BY, default="hash", help="hash of the url (default) or contiguous ranges")
+    parser.add_argument("--work-dir", default="shards", help="shard logs, reports and timings before the merge")
+    parser.add_argument("-s", "--set", dest="settings", action="append", default=[], metavar="NAME=VALUE",
+                        help="setting for every shard, as with scrapy crawl")
+    args = parser.parse_args()
+
+    settings = get_project_settings()
+    overrides = arglist_to_dict(args.settings)
+    settings.setdict(overrides, priority="cmdline")
+    logging.basicConfig(level=logging.INFO, format=settings.get("LOG_FORMAT"), datefmt=settings.get("LOG_DATEFORMAT"))
+    logger = logging.getLogger("runner")
+
+    if not settings.getbool("OFFLINE"): # offline shards never log in
+        login_once(settings, logger)
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    if settings.get("REPORT_RUN_ID"):
+        run_id = settings.get("REPORT_RUN_ID")
+    elif settings.get("JOBDIR"):
+        from chronicle.report_store import job_run_id
+        run_id = job_run_id(settings.get("JOBDIR"))
+    else:
+        run_id = time.strftime("%Y-%m-%dT%H:%M:%S")
+    report_store = settings.get("REPORT_STORE")
+    metrics_file = settings.get("STAGE_METRICS_FILE") if settings.getbool("STAGE_METRICS_ENABLED") else None
+    prometheus_file = settings.get("STAGE_METRICS_PROMETHEUS") if settings.getbool("STAGE_METRICS_ENABLED") else None
+    shard_paths = [
+        {
+            "log": os.path.join(args.work_dir, f"shard-{shard}.log"),
+            "reports": os.path.join(args.work_dir, f"shard-{shard}.db") if report_store else None,
+            "metrics": os.path.join(args.work_dir, f"shard-{shard}.json") if metrics_file or prometheus_file else None,
+        }
+        for shard in range(args.shards)
+    ]
+
+    started = time.time()
+    processes = [
+        subprocess.Popen(shard_command(shard, args.shards, args.by, paths, run_id, overrides))
+        for shard, paths in enumerate(shard_paths)
+    ]
+    logger.info(f"Started {args.shards} shards (by {args.by}), logs in {args.work_dir}/")
+    try:
+        codes = [process.wait() for process in processes]
+    except KeyboardInterrupt:
+        # Ctrl+C reaches the shards too, they close gracefully and what they tested is still merged
+        logger.warning("Interrupted, waiting for the shards to stop")
+        codes = [process.wait() for process in processes]
+    logger.info(f"Shards finished in {time.time() - started:.1f}s, exit codes {codes}")
+
+    if report_store:
+        merge_reports(report_store, [paths["reports"] for paths in shard_paths], run_id, logger)
+    if metrics_file or prometheus_file:
+        merge_metrics(metrics_file, prometheus_file, [paths["metrics"] for paths in shard_paths], logger)
+    sys.exit(max(codes, default=0))
+
+
+if __name__ == "__main__":
+    main()
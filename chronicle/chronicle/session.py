@@ -0,0 +1,62 @@
+import json
+import os
+import time
+import urllib.request
+
+
+class SessionCache:
+    """AUTHENTICATED SESSION COOKIES ON DISK. TRACKS EXPIRY, CHECKED WITH ONE PLAIN HTTP REQUEST BEFORE REUSE."""
+
+    def __init__(self, path, max_age=12 * 3600, probe_url=None, probe_marker=None, probe_timeout=5):
+        self.path = path
+        self.max_age = max_age
+        self.probe_url = probe_url
+        self.probe_marker = probe_marker
+        self.probe_timeout = probe_timeout
+
+    # Cookies of the cached session (selenium get_cookies() format), None if there is none or it expired
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                session = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        now = time.time()
+        if session.get("saved_at", 0) + self.max_age < now:
+            return None
+        cookies = session.get("cookies") or []
+        if not cookies or any(cookie.get("expiry") and cookie["expiry"] < now for cookie in cookies):
+            return None
+        return cookies
+
+    def save(self, cookies):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        # Credentials, same as .env: readable by the owner only
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"saved_at": int(time.time()), "cookies": cookies}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    # True if the site still treats the cookies as signed in. Without probe_url the expiry check is trusted
+    def probe(self, cookies):
+        if not self.probe_url:
+            return True
+        header = "; ".join(f"{cookie['name']}={cookie['value']}" for cookie in cookies)
+        request = urllib.request.Request(self.probe_url, headers={"Cookie": header})
+        try:
+            with urllib.request.urlopen(request, timeout=self.probe_timeout) as response:
+                if response.status != 200:
+                    return False
+                if not self.probe_marker:
+                    return True
+                return self.probe_marker.encode("utf-8") in response.read()
+        except Exception:
+            return False
@@ -1,4 +1,4 @@
-from chronicle.parse_parameters import VERBOSE, DEFAULT_LOGS_DISABLED
+from chronicle.parse_parameters import BASE_URL, VERBOSE, DEFAULT_LOGS_DISABLED, OFFLINE, SNAPSHOT_DIR, VALIDATION_WORKERS, TEST_CONFIG
 # Scrapy settings for chronicle project
 #
 # For simplicity, this file contains only settings considered important or
@@ -21,7 +21,8 @@ NEWSPIDER_MODULE = "chronicle.spiders"
 ROBOTSTXT_OBEY = False
 
 # Configure maximum concurrent requests performed by Scrapy (default: 16)
-#CONCURRENT_REQUESTS = 32
+# With ADAPTIVE_CONCURRENCY_ENABLED this is the ceiling of all endpoint classes together
+CONCURRENT_REQUESTS = 64
 
 # Configure a delay for requests for the same website (default: 0)
 # See https://docs.scrapy.org/en/latest/topics/settings.html#download-delay
@@ -54,23 +55,49 @@ SPIDER_MIDDLEWARES = {
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 DOWNLOADER_MIDDLEWARES = {
     "chronicle.middlewares.LoggingMiddleware": 3,
+    "chronicle.middlewares.SnapshotMiddleware": 580,
     "chronicle.middlewares.LoginMiddleware": 600,
     "scrapy.downloadermiddlewares.cookies.CookiesMiddleware": 700,
 }
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
-#    "scrapy.extensions.telnet.TelnetConsole": None,
-#}
+EXTENSIONS = {
+    "chronicle.extensions.AdaptiveConcurrency": 500,
+    "chronicle.extensions.StageTimings": 510,
+}
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-#ITEM_PIPELINES = {
-#    "chronicle.pipelines.ChroniclePipeline": 300,
-#}
+ITEM_PIPELINES = {
+    "chronicle.pipelines.ValidationPipeline": 100,
+    "chronicle.pipelines.ReportStorePipeline": 200,
+    "chronicle.pipelines.TestLedgerPipeline": 250,
+    "chronicle.pipelines.ChroniclePipeline": 300,
+}
+
+# Adaptive concurrency per endpoint class (listing, search, article), see chronicle.extensions.
+# Each class starts at ADAPTIVE_CONCURRENCY_START parallel requests and moves between MIN and MAX every WINDOW responses:
+# +1 while the median latency stays under LATENCY_FACTOR x the best one seen, -1 above it, halved when more than
+# ERROR_RATE of the window are 5xx/429/timeouts
+ADAPTIVE_CONCURRENCY_ENABLED = True
+ADAPTIVE_CONCURRENCY_START = 8
+ADAPTIVE_CONCURRENCY_MIN = 1
+ADAPTIVE_CONCURRENCY_MAX = 32
+ADAPTIVE_CONCURRENCY_WINDOW = 50
+ADAPTIVE_CONCURRENCY_ERROR_RATE = 0.1
+ADAPTIVE_CONCURRENCY_LATENCY_FACTOR = 2.0
+
+# Duration histograms of download, login, selector, CleanData and RunTests, see chronicle.extensions.StageTimings.
+# Summaries are pushed to the stats every STAGE_METRICS_INTERVAL seconds and logged at the end, full histograms are in
+# STAGE_METRICS_FILE. STAGE_METRICS_PROMETHEUS: text file for node_exporter's textfile collector, rewritten with the stats
+STAGE_METRICS_ENABLED = True
+STAGE_METRICS_FILE = "metrics.json"
+STAGE_METRICS_PROMETHEUS = None
+STAGE_METRICS_INTERVAL = 60
 
 # Enable and configure the AutoThrottle extension (disabled by default)
+# (it adjusts delays, not concurrency: leave it off with ADAPTIVE_CONCURRENCY_ENABLED)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
 #AUTOTHROTTLE_ENABLED = True
 # The initial download delay
@@ -97,6 +124,62 @@ FEED_EXPORT_ENCODING = "utf-8"
 
 
 DEFAULT_LOGS_DISABLED = DEFAULT_LOGS_DISABLED
+
+# Site under test, override to crawl a local copy: scrapy crawl article-latest -s BASE_URL=http://127.0.0.1:8080
+BASE_URL = BASE_URL
+
+# Article body snapshots, see chronicle.snapshots
+SNAPSHOTS_ENABLED = True
+SNAPSHOT_DIR = SNAPSHOT_DIR
+OFFLINE = OFFLINE
+
+# Login session cache, see chronicle.session. Cookies are reused between runs while fresh,
+# the probe page must contain the marker for a signed in user, otherwise the browser login runs again
+SESSION_FILE = ".session/cookies.json"
+SESSION_MAX_AGE = 12 * 3600
+SESSION_PROBE_URL = "/" # relative to BASE_URL
+SESSION_PROBE_MARKER = "user-menu-trigger"
+LOGIN_TIMEOUT = 10
+# A 401 or a redirect to an url whose path is one of these, or under it, logs in again (MAX_RELOGINS times per request)
+SIGN_IN_URL_PATTERNS = ["/login", "/authorize", "/u/login"]
+MAX_RELOGINS = 2
+
+# Discovered urls are written to the .jsonl output files every DISCOVERY_BATCH_SIZE items
+DISCOVERY_BATCH_SIZE = 100
+# Discovery spiders stop downloading a page as soon as the article body tag arrives
+DISCOVERY_STREAM_CLASSIFY = True
+# Sitemap index of 'article-sitemap', relative to BASE_URL. SITEMAP_CLASSIFY: load every listed page to check it's an article
+SITEMAP_URL = "/sitemap.xml"
+SITEMAP_CLASSIFY = False
+# 'article-latest' learns the 'load more' url pattern from the first two pages and keeps this many pages in flight, 0: one by one
+LATEST_PAGE_WINDOW = 4
+
+# Duplicate requests: fingerprints of canonical urls (tracking parameters, trailing slash, fragment... dropped) in a
+# Bloom filter, see chronicle.dupefilter. Memory is fixed by the capacity (~1.8 MB for a million urls at 0.001),
+# past it more new requests are taken for duplicates. Discovered urls are stored canonical in URL_INDEX and the .jsonl files
+DUPEFILTER_CLASS = "chronicle.dupefilter.BloomDupeFilter"
+DUPEFILTER_CAPACITY = 1_000_000
+DUPEFILTER_ERROR_RATE = 0.001
+CANONICAL_DROP_PARAMS = ["utm_*", "fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "_ga", "_gl", "cmpid"]
+
+# Offset/frequency rules of the 'article' spider, see chronicle.test_config. Urls without a rule get FREQUENCY/OFFSET
+# (SEARCH, LATEST, SITEMAP) or their ARTICLES entry. Lookups are cached, TEST_CONFIG_CACHE_SIZE urls at most
+TEST_CONFIG = TEST_CONFIG
+TEST_CONFIG_CACHE_SIZE = 10000
+
+# Process pool for CleanData/RunTests, see chronicle.pipelines.ValidationPipeline
+VALIDATION_WORKERS = VALIDATION_WORKERS
+
+# Test reports of ArticleSpider, see chronicle.report_store. None disables the store
+REPORT_STORE = "reports.db"
+REPORT_BATCH_SIZE = 500
+REPORT_RUN_ID = None # None: start time of the crawl (of the job with JOBDIR). chronicle.runner gives all its shards the same one
+
+# Resumable runs: scrapy crawl article -s JOBDIR=jobs/nightly keeps the request queue in JOBDIR, and with the ledger
+# (JOBDIR/ledger.db) a run started again with the same JOBDIR skips articles already tested on the same content
+TEST_LEDGER_ENABLED = True
+TEST_LEDGER_BATCH_SIZE = 20 # tests redone after a crash, at most (REPORT_BATCH_SIZE is lowered to it)
+
 LOG_ENABLED = True
 if VERBOSE:
     LOG_LEVEL = "INFO"
@@ -104,4 +187,10 @@ else:
     LOG_LEVEL = "WARNING"
 LOG_FILE = "ad.log"
 LOG_FORMAT = "%(asctime)s [%(name)s] %(levelname)s: %(message)s"
-LOG_DATEFORMAT = "%Y-%m-%d %H:%M:%S"
\ No newline at end of file
+LOG_DATEFORMAT = "%Y-%m-%d %H:%M:%S"
+# Log records are queued and written by a background thread (chronicle.logger.QueueLogging), not by the reactor
+LOG_QUEUE = True
+# LOG_FILE rotation at LOG_MAX_BYTES (0: never), LOG_BACKUP_COUNT old files kept, gzipped with LOG_COMPRESS
+LOG_MAX_BYTES = 0
+LOG_BACKUP_COUNT = 5
+LOG_COMPRESS = False
@@ -0,0 +1,63 @@
+import json
+import os
+
+
+class JsonLinesSink:
+    """APPEND-ONLY JSON LINES FILE, ONE OBJECT PER LINE, WRITTEN IN BATCHES. A CRASH LOSES AT MOST ONE BATCH."""
+
+    def __init__(self, path, batch_size=100, append=True):
+        self.path = path
+        self.batch_size = batch_size
+        self.buffer = []
+        self.written = 0
+        torn_line = append and os.path.exists(path) and _ends_without_newline(path)
+        self.file = open(path, "a" if append else "w", encoding="utf-8")
+        if torn_line:
+            self.file.write("\n") # last line of a crashed run stays alone, read_urls skips it
+
+    def write(self, record):
+        self.buffer.append(json.dumps(record, ensure_ascii=False))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.file.write("\n".join(self.buffer) + "\n")
+            self.written += len(self.buffer)
+            self.buffer = []
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def _ends_without_newline(path):
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if not f.tell():
+            return False
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+
+def read_urls(path):
+    # Lazily yields the urls of a .jsonl sink (repeats are dropped by the scheduler's dupefilter).
+    # Falls back to the old {url: {}} .json file with the same name, e.g. the committed articles_legacy.json
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    url = json.loads(line)["url"]
+                except (ValueError, KeyError):
+                    continue # half written last line of a crashed run
+                yield url
+        return
+
+    legacy_path = f"{os.path.splitext(path)[0]}.json"
+    if os.path.exists(legacy_path):
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            yield from json.load(f).keys()
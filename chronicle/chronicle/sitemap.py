@@ -0,0 +1,46 @@
+import zlib
+from lxml import etree
+
+CHUNK_SIZE = 64 * 1024
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def _localname(element):
+    tag = element.tag
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else None
+
+
+def _entries(parser):
+    for _, element in parser.read_events():
+        kind = _localname(element)
+        if kind not in ("url", "sitemap"):
+            continue
+        fields = {_localname(child): (child.text or "").strip() for child in element}
+        yield kind, fields.get("loc") or None, fields.get("lastmod") or None
+        # Done with it: the tree never holds more than the entry being parsed
+        element.clear()
+        parent = element.getparent()
+        if parent is not None:
+            while element.getprevious() is not None:
+                del parent[0]
+
+
+def iter_sitemap(body, chunk_size=CHUNK_SIZE):
+    # (kind, loc, lastmod) of every entry of a sitemap ("url") or a sitemap index ("sitemap"), in document order.
+    # The XML is parsed in chunks (gzipped sitemaps are decompressed chunk by chunk), entries are dropped once yielded
+    parser = etree.XMLPullParser(events=("end",), resolve_entities=False, no_network=True, huge_tree=True, recover=True)
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if body[:2] == GZIP_MAGIC else None
+    for position in range(0, len(body), chunk_size):
+        chunk = body[position:position + chunk_size]
+        parser.feed(decompressor.decompress(chunk) if decompressor else chunk)
+        yield from _entries(parser)
+    try:
+        parser.close()
+    except etree.XMLSyntaxError: # empty or cut off, what was parsed is yielded already
+        return
+    yield from _entries(parser)
+
+
+def modified_since(lastmod, since):
+    # W3C datetimes ("2024-05-01", "2024-05-01T10:00:00+00:00") compared by day. No lastmod: can't tell, kept
+    return not since or not lastmod or lastmod[:10] >= since
@@ -0,0 +1,103 @@
+import fcntl
+import hashlib
+import json
+import os
+import time
+import zlib
+
+ARTICLE_BODY_CSS = "div.RichTextArticleBody-body.RichTextBody"
+
+
+def content_digest(fragment):
+    return hashlib.sha1(fragment.encode("utf-8")).hexdigest()
+
+
+class SnapshotStore:
+    """SNAPSHOTS OF ARTICLE BODIES. CONTENT-ADDRESSED, ZLIB-COMPRESSED, INDEXED BY URL WITH ETAG/LAST-MODIFIED."""
+
+    def __init__(self, path):
+        self.path = path
+        self.objects_path = os.path.join(path, "objects")
+        self.index_path = os.path.join(path, "index.json")
+        self.index = self._load_index()
+        self.changed = set() # urls put since the last save
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_path, digest[:2], digest[2:])
+
+    def __contains__(self, url):
+        return url in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def urls(self):
+        return self.index.keys()
+
+    def digest(self, url):
+        entry = self.index.get(url)
+        return entry["digest"] if entry else None
+
+    def validators(self, url):
+        entry = self.index.get(url)
+        if not entry:
+            return None, None
+        return entry.get("etag"), entry.get("last_modified")
+
+    def get(self, url):
+        entry = self.index.get(url)
+        if not entry:
+            return None
+        try:
+            with open(self._object_path(entry["digest"]), "rb") as f:
+                return zlib.decompress(f.read()).decode("utf-8")
+        except FileNotFoundError:
+            return None
+
+    def put(self, url, fragment, etag=None, last_modified=None):
+        data = fragment.encode("utf-8")
+        digest = content_digest(fragment)
+        entry = self.index.get(url)
+        if entry and entry["digest"] == digest and entry.get("etag") == etag and entry.get("last_modified") == last_modified:
+            return digest
+
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path): # same body under another url is stored once
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            tmp_path = f"{object_path}.{os.getpid()}.tmp" # shards may store the same body at the same time
+            with open(tmp_path, "wb") as f:
+                f.write(zlib.compress(data, 6))
+            os.replace(tmp_path, object_path)
+
+        self.index[url] = {
+            "digest": digest,
+            "etag": etag,
+            "last_modified": last_modified,
+            "stored_at": int(time.time()),
+        }
+        self.changed.add(url)
+        return digest
+
+    def save(self):
+        # Other processes (shards of chronicle.runner) may have saved meanwhile: their entries are kept, ours go on top
+        if not self.changed:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "index.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            index = self._load_index()
+            for url in self.changed:
+                index[url] = self.index[url]
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(index, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+        self.index = index
+        self.changed = set()
@@ -1,148 +1,491 @@
 import scrapy
-import json
-from chronicle.parse_parameters import ARTICLES, MAX_PAGES_TO_LOAD, LATEST, SEARCH
-from chronicle.utils import clean_data_and_run_tests
+import re
+import zlib
+from scrapy import signals
+from scrapy.exceptions import StopDownload
+from urllib.parse import urljoin, urlparse
+from chronicle.parse_parameters import (
+    ARTICLES, BASE_URL, MAX_PAGES_TO_LOAD, LATEST, SEARCH, SITEMAP, SITEMAP_SINCE, INCREMENTAL, URL_INDEX,
+)
+from chronicle.url_index import UrlIndex
+from chronicle.dupefilter import TRACKING_PARAMS, canonical_url
+from chronicle.utils import clean_data_and_run_tests, test_pairs
+from chronicle.items import ArticleItem, ChronicleItem
+from chronicle.runner import shard_urls
+from chronicle.sink import read_urls
+from chronicle.extract import article_body, has_article_body
+from chronicle.sitemap import iter_sitemap, modified_since
+from chronicle.snapshots import content_digest
+from chronicle.test_config import TestConfig
 
-# Parses through the https://qa.brightspot.chronicle.com/article/ to find articles urls, 
-# pushes 'load more' button MAX_PAGES_TO_LOAD times
-# writes the urls to articles.json
-class ArticleLatestSpider(scrapy.Spider):
-    name = "article-latest"
-    allowed_domains = ["qa.brightspot.chronicle.com"]
-    start_urls = ["https://qa.brightspot.chronicle.com/article/"]
+# Opening tag of the article body, enough to classify a page before the rest of it is downloaded
+ARTICLE_BODY_TAG = re.compile(rb'<div[^>]+class="[^"]*RichTextArticleBody-body[^>]*>')
+# Content-Encodings bytes_received can search in (decompressed as they arrive), others are downloaded in full
+STREAM_ENCODINGS = (b"gzip", b"x-gzip", b"deflate")
+# Per-response state of bytes_received in request.meta, dropped before redirects, retries and relogins copy the meta
+CLASSIFY_STATE = ("classify_decoder", "classify_stream", "classify_tail")
+ARTICLE_PATH = re.compile(r"^/article/[^/]+")
+NUMBER = re.compile(r"(\d+)")
+
+
+def pagination_pattern(link, next_link):
+    # (prefix, number, step, suffix) if the two links only differ by one number that grows, e.g. ?p=2 -> ?p=3
+    # or ?offset=20 -> ?offset=40. None if there's no such number
+    parts, next_parts = NUMBER.split(link), NUMBER.split(next_link)
+    if len(parts) != len(next_parts):
+        return None
+    changed = [i for i, (part, next_part) in enumerate(zip(parts, next_parts)) if part != next_part]
+    if len(changed) != 1 or changed[0] % 2 == 0: # odd parts are the numbers
+        return None
+    i = changed[0]
+    step = int(next_parts[i]) - int(parts[i])
+    if step <= 0:
+        return None
+    return "".join(parts[:i]), int(parts[i]), step, "".join(parts[i + 1:])
+
+
+# Common part of the discovery spiders: url index, article/not article check of a page, output items.
+# Verdicts are cached in URL_INDEX with the page's ETag/Last-Modified, revisits are conditional requests and
+# a 304 reuses the verdict. Pages are classified while they stream in, the download stops at the article body tag
+# (gzipped or deflated pages are decompressed on the way, HttpCompressionMiddleware gets the part that arrived).
+class DiscoverySpider(scrapy.Spider):
+    allowed_domains = [urlparse(BASE_URL).hostname]
 
     custom_settings = {
         "FEED_EXPORT_ENCODING": "utf-8",
     }
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.stream_classify = crawler.settings.getbool("DISCOVERY_STREAM_CLASSIFY", True)
+        spider.base_url = crawler.settings.get("BASE_URL", BASE_URL).rstrip("/")
+        spider.allowed_domains = [urlparse(spider.base_url).hostname]
+        spider.drop_params = crawler.settings.getlist("CANONICAL_DROP_PARAMS", TRACKING_PARAMS)
+        crawler.signals.connect(spider.headers_received, signal=signals.headers_received)
+        crawler.signals.connect(spider.bytes_received, signal=signals.bytes_received)
+        crawler.signals.connect(spider.request_left_downloader, signal=signals.request_left_downloader)
+        return spider
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.index = UrlIndex(URL_INDEX)
+        self.incremental = INCREMENTAL # skip urls checked on previous runs, stop at the first page with nothing new
+        self.stream_classify = True
+        self.base_url = BASE_URL
+        self.drop_params = TRACKING_PARAMS
+
+    def canonical(self, url):
+        # the same article under other urls (tracking parameters, trailing slash...) is one url in the index and output
+        return canonical_url(url, self.drop_params)
+
+    def is_checked(self, url):
+        is_new = self.index.add(url)
+        return self.incremental and not is_new and self.index.is_classified(url)
+
+    def article_request(self, url):
+        headers = {}
+        cached = self.index.verdict(url)
+        if cached:
+            _, etag, last_modified = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        return scrapy.Request(
+            url=url,
+            callback=self.parse_article,
+            headers=headers,
+            cb_kwargs={"url": url},
+            meta={"handle_httpstatus_list": [304], "classify": True},
+        )
+
+    def headers_received(self, headers, body_length, request, spider):
+        # bytes_received gets the body as sent, before HttpCompressionMiddleware
+        if spider is not self or not self.stream_classify or not request.meta.get("classify"):
+            return
+        for key in CLASSIFY_STATE:
+            request.meta.pop(key, None) # of an earlier response, if the request was copied with it
+        encoding = (headers.get("Content-Encoding") or b"identity").strip().lower()
+        if encoding in STREAM_ENCODINGS:
+            request.meta["classify_decoder"] = zlib.decompressobj(32 + zlib.MAX_WBITS) # gzip or zlib header
+        elif encoding != b"identity":
+            request.meta["classify_stream"] = False # br, zstd...
+
+    def bytes_received(self, data, request, spider):
+        if spider is not self or not self.stream_classify or not request.meta.get("classify"):
+            return
+        if request.meta.get("classify_stream") is False:
+            return
+        decoder = request.meta.get("classify_decoder")
+        if decoder is not None:
+            try:
+                data = decoder.decompress(data)
+            except zlib.error: # not what Content-Encoding says (raw deflate...), downloaded in full
+                request.meta["classify_stream"] = False
+                return
+        window = request.meta.get("classify_tail", b"") + data
+        if ARTICLE_BODY_TAG.search(window):
+            raise StopDownload(fail=False) # callback gets what arrived so far, the body tag included
+        request.meta["classify_tail"] = window[-1024:]
+
+    def request_left_downloader(self, request, spider):
+        # sent before the downloader middlewares see the response or error: the decoder (not picklable for JOBDIR
+        # queues) and the tail don't reach the request RedirectMiddleware, RetryMiddleware or LoginMiddleware make of it
+        if spider is self and request.meta.get("classify"):
+            for key in CLASSIFY_STATE:
+                request.meta.pop(key, None)
+
+    def parse_article(self, response, url=None):
+        url = url or response.url
+        cached = self.index.verdict(url) if response.status == 304 else None
+        if cached:
+            is_article = cached[0]
+            self.index.touch(url)
+        else:
+            is_article = has_article_body(response)
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            self.index.classify(
+                url,
+                is_article,
+                etag=etag.decode("latin-1") if etag else None,
+                last_modified=last_modified.decode("latin-1") if last_modified else None,
+            )
+        if is_article:
+            self.logger.info(f"Article found and added: {response.url}")
+            yield ChronicleItem(url=self.canonical(response.url)) # in case you need to store extra information about the article, add fields to the item
+        else:
+            self.logger.warning(f"No article content found at: {response.url}")
+
+    def closed(self, reason):
+        self.index.close()
+
+
+# Parses through the BASE_URL/article/ to find articles urls, 
+# pushes 'load more' button MAX_PAGES_TO_LOAD times
+# streams the urls to articles_latest.jsonl (ChroniclePipeline)
+# Once the 'load more' links of the first two pages show the url pattern, LATEST_PAGE_WINDOW next pages are requested
+# at once instead of one per round trip. An empty page, the last page or a link off the pattern stops that.
+class ArticleLatestSpider(DiscoverySpider):
+    name = "article-latest"
+    output_file = "articles_latest.jsonl"
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.page_window = crawler.settings.getint("LATEST_PAGE_WINDOW", 4)
+        return spider
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.articles = {}
         self.pages_loaded = 0
         self.max_pages = MAX_PAGES_TO_LOAD
+        self.page_window = 0
+        self.page_links = {} # page -> its 'load more' link, until the pattern is known
+        self.pattern = None # (page, prefix, number, step, suffix) of pagination_pattern, page is the one with that number
+        self.last_page = None # page number requested last
+        self.stopped = False
 
     def start_requests(self):
         self.logger.warning(f"{'='*50} STARTING SCRAPPING URLS FROM LATEST {'='*50}")
-        # launch default start_urls
-        for url in self.start_urls:
-            yield scrapy.Request(
-                url,
-                self.parse,
-            )
+        self.last_page = 1
+        yield scrapy.Request(
+            f"{self.base_url}/article/",
+            self.parse,
+            cb_kwargs={"page": 1},
+        )
 
-    def parse(self, response):
+    def page_url(self, page):
+        first_page, prefix, number, step, suffix = self.pattern
+        return f"{prefix}{number + (page - first_page) * step}{suffix}"
+
+    def page_request(self, url, page):
+        self.pages_loaded += 1
+        self.last_page = page
+        self.logger.info(f"Loading page {self.pages_loaded}")
+        # ahead of the article pages found so far, the window isn't held back behind them
+        return scrapy.Request(url=url, callback=self.parse, cb_kwargs={"page": page}, priority=1)
+
+    def page_window_requests(self, page):
+        # keeps the pages up to page + page_window requested
+        while self.last_page < page + self.page_window and self.pages_loaded < self.max_pages:
+            self.crawler.stats.inc_value("pagination/speculative_requests")
+            yield self.page_request(self.page_url(self.last_page + 1), self.last_page + 1)
+
+    def learn_pattern(self, page, link):
+        # link of page + 1, compared with the one of page - 1 (the url of page)
+        self.page_links[page] = link
+        if self.page_window <= 0 or page - 1 not in self.page_links:
+            return
+        pattern = pagination_pattern(self.page_links[page - 1], link)
+        if pattern is None:
+            self.logger.info("No page number in 'load more' links, loading pages one by one")
+            self.page_window = 0
+            return
+        self.pattern = (page, *pattern)
+        self.page_links = {}
+        self.logger.info(f"Pagination pattern found, loading {self.page_window} pages at once")
+
+    def parse(self, response, page=1):
         article_cards = response.css("div.ListLoadMore-items div.ContentPromo-side")
+        new_urls = 0
         for card in article_cards:
             article_url = card.css("div.ContentPromo-side-title a::attr(href)").get()
             if article_url:
-                article_url = response.urljoin(article_url)
-                yield scrapy.Request(url=article_url, callback=self.parse_article)
+                article_url = self.canonical(response.urljoin(article_url))
+                if self.is_checked(article_url):
+                    continue # checked on a previous run
+                new_urls += 1
+                yield self.article_request(article_url)
 
         load_more = response.css("div.ListLoadMore-nextPage a::attr(href)").get()
-        if load_more and self.pages_loaded < self.max_pages:
-            self.pages_loaded += 1
-            next_page = response.urljoin(load_more)
-            self.logger.info(f"Loading page {self.pages_loaded}")
-            yield scrapy.Request(url=next_page, callback=self.parse)
+        next_page = response.urljoin(load_more) if load_more else None
+        if self.stopped:
+            return # requested ahead of a page that stopped the crawl
+        if not article_cards:
+            self.stopped = True
+            self.logger.info(f"Page {page} is empty. Stopping.")
+        elif self.incremental and not new_urls:
+            self.stopped = True
+            self.logger.info(f"Only known articles on page {page}. Stopping.")
+        elif not next_page:
+            self.stopped = True
+            self.logger.info(f"Page {page} is the last one. Stopping.")
         elif self.pages_loaded >= self.max_pages:
             self.logger.info("Maximum number of pages loaded. Stopping.")
-
-    def parse_article(self, response):
-        if response.css("div.RichTextArticleBody-body.RichTextBody"):
-            self.articles[response.url] = {} # in case you need to store extra information about the article, add to dictionary
-            self.logger.info(f"Article found and added: {response.url}")
-
-    def closed(self, reason):
-        with open("articles_latest.json", "w", encoding="utf-8") as f:
-            json.dump(self.articles, f, ensure_ascii=False, indent=4)
-        self.logger.info(f"Saved articles to articles_latest.json")
+        elif self.pattern and next_page != self.page_url(page + 1):
+            # off the pattern, on with the links themselves (pages requested twice are dropped by the dupefilter)
+            self.logger.warning(f"'load more' link of page {page} is not {self.page_url(page + 1)}, loading pages one by one")
+            self.pattern = None
+            self.page_window = 0
+            yield self.page_request(next_page, page + 1)
+        elif self.pattern:
+            yield from self.page_window_requests(page)
+        else:
+            self.learn_pattern(page, next_page)
+            if self.pattern:
+                yield from self.page_window_requests(page)
+            else:
+                yield self.page_request(next_page, page + 1)
 
 
-class ArticleSearchSpider(scrapy.Spider):
+class ArticleSearchSpider(DiscoverySpider):
     name = "article-search"
-    allowed_domains = ["qa.brightspot.chronicle.com"]
+    output_file = "articles_legacy.jsonl"
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+    def start_requests(self):
+        self.logger.warning(f"{'='*50} STARTING SCRAPING FROM SEARCH {'='*50}")
         self.start_urls = [
-            f"https://qa.brightspot.chronicle.com/search-legacy/?p={page}"
+            f"{self.base_url}/search-legacy/?p={page}"
             for page in range(1, MAX_PAGES_TO_LOAD)
         ]
-        self.articles = {}
-
-    custom_settings = {
-        "FEED_EXPORT_ENCODING": "utf-8",
-    }
-
-    def start_requests(self):
-        self.logger.warning(f"{'='*50} STARTING SCRAPING FROM SEARCH {'='*50}")
-        for url in self.start_urls:
+        # INCREMENTAL: pages are loaded one by one, until a page has nothing new
+        start_urls = self.start_urls[:1] if self.incremental else self.start_urls
+        for page, url in enumerate(start_urls, start=1):
             yield scrapy.Request(
                 url,
                 self.parse,
+                cb_kwargs={"page": page},
             )
 
-    def parse(self, response):
+    def parse(self, response, page=None):
         article_cards = response.css("div.SearchResultsModule-results div.PromoSearchResult")
+        new_urls = 0
         for card in article_cards:
             article_url = card.css("div.PromoSearchResult-title a::attr(href)").get()
             if article_url:
-                yield scrapy.Request(url=article_url, callback=self.parse_article)
+                article_url = self.canonical(response.urljoin(article_url))
+                if self.is_checked(article_url):
+                    continue # checked on a previous run
+                new_urls += 1
+                yield self.article_request(article_url)
 
-    def parse_article(self, response):
-        if response.css("div.RichTextArticleBody-body.RichTextBody"):
-            self.articles[response.url] = {}
-            self.logger.info(f"Article found and added: {response.url}")
-        else:
-            self.logger.warning(f"No article content found at: {response.url}")
+        if self.incremental:
+            if not new_urls:
+                self.logger.info(f"Only known articles on page {page}. Stopping.")
+            elif page < len(self.start_urls):
+                yield scrapy.Request(self.start_urls[page], self.parse, cb_kwargs={"page": page + 1})
+
+
+# Reads BASE_URL/sitemap.xml (SITEMAP_URL) and its child sitemaps with a streaming XML parser, /article/ urls are
+# streamed to articles_sitemap.jsonl (ChroniclePipeline) without loading the pages. With SITEMAP_SINCE (or -a since=...)
+# only urls modified since that day are kept, and child sitemaps older than that are not even requested.
+# Urls the url index knows as not articles are left out, SITEMAP_CLASSIFY = True loads and classifies every page instead.
+# An url is listed once per run, in whatever sitemaps and forms (canonical_url) it appears.
+class ArticleSitemapSpider(DiscoverySpider):
+    name = "article-sitemap"
+    output_file = "articles_sitemap.jsonl"
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.classify = crawler.settings.getbool("SITEMAP_CLASSIFY", False)
+        spider.sitemap_url = urljoin(f"{spider.base_url}/", crawler.settings.get("SITEMAP_URL", "/sitemap.xml"))
+        return spider
+
+    def __init__(self, *args, since=SITEMAP_SINCE, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.since = since
+        self.classify = False
+        self.sitemap_url = f"{self.base_url}/sitemap.xml"
+        self.sitemaps = 0
+        self.found = 0
+        self.listed = set() # canonical urls of this run, one line per article even if several sitemaps list it
+
+    def start_requests(self):
+        self.logger.warning(f"{'='*50} STARTING SCRAPING URLS FROM SITEMAP {'='*50}")
+        yield scrapy.Request(self.sitemap_url, self.parse)
+
+    def on_base_url(self, url):
+        # Sitemaps may list the production host, tests run against BASE_URL
+        parsed = urlparse(url)
+        return urljoin(f"{self.base_url}/", parsed.path + (f"?{parsed.query}" if parsed.query else ""))
+
+    def parse(self, response):
+        self.sitemaps += 1
+        old = 0
+        for kind, loc, lastmod in iter_sitemap(response.body):
+            if not loc:
+                continue
+            if not modified_since(lastmod, self.since):
+                old += 1
+                continue
+            if kind == "sitemap": # entry of a sitemap index
+                yield scrapy.Request(self.on_base_url(loc), self.parse)
+                continue
+            if not ARTICLE_PATH.match(urlparse(loc).path):
+                continue
+            url = self.canonical(self.on_base_url(loc))
+            if url in self.listed:
+                continue # in another child sitemap, or another form of an url already listed
+            self.listed.add(url)
+            if self.is_checked(url):
+                continue # checked on a previous run
+            if self.classify:
+                self.found += 1
+                yield self.article_request(url)
+                continue
+            cached = self.index.verdict(url)
+            if cached and not cached[0]:
+                continue # known as not an article
+            self.found += 1
+            yield ChronicleItem(url=url)
+        self.logger.info(f"Sitemap {response.url} read, {old} entries older than {self.since} skipped")
 
     def closed(self, reason):
-        with open("articles_legacy.json", "w", encoding="utf-8") as f:
-            json.dump(self.articles, f, ensure_ascii=False, indent=4)
-        self.logger.info(f"Saved articles to articles_legacy.json")
+        self.logger.info(f"{self.sitemaps} sitemaps read, {self.found} article urls listed")
+        super().closed(reason)
 
 
 class ArticleSpider(scrapy.Spider):
     name = "article"
+    use_snapshots = True # bodies are stored by SnapshotMiddleware, OFFLINE in parse_parameters.py replays them
 
-    def __init__(self, *args, **kwargs):
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        path = crawler.settings.get("TEST_CONFIG")
+        if path:
+            spider.test_config = TestConfig(path, cache_size=crawler.settings.getint("TEST_CONFIG_CACHE_SIZE", 10000))
+        return spider
+
+    # shard/shards/shard_by (-a ...): test only one part of the urls, set by chronicle.runner
+    def __init__(self, *args, shard=0, shards=1, shard_by="hash", **kwargs):
         super(ArticleSpider, self).__init__(*args, **kwargs)
+        self.shard = int(shard)
+        self.shards = int(shards)
+        self.shard_by = shard_by
+        self.test_config = None # offset/frequency rules of TEST_CONFIG
 
-    def start_requests(self):
-        self.logger.warning(f"{'='*50} STARTING TESTS {'='*50}")
+    def article_urls(self):
+        # read lazily, requests are created as the scheduler asks for them
         if SEARCH:
-            with open("articles_legacy.json", "r", encoding="utf-8") as f:
-                articles = json.load(f).keys()
+            return read_urls(ArticleSearchSpider.output_file)
         elif LATEST:
-            with open("articles_latest.json", "r", encoding="utf-8") as f:
-                articles = json.load(f).keys()
-        else:
-            articles = ARTICLES.keys()
+            return read_urls(ArticleLatestSpider.output_file)
+        elif SITEMAP:
+            return read_urls(ArticleSitemapSpider.output_file)
+        elif self.test_config is not None:
+            return self.test_config.urls() # the url rules of TEST_CONFIG instead of ARTICLES
+        return ARTICLES.keys()
+
+    def start_requests(self):
+        self.logger.warning(f"{'='*50} STARTING TESTS {'='*50}")
+        articles = self.article_urls()
+        if self.shards > 1:
+            self.logger.warning(f"Shard {self.shard + 1} of {self.shards} (by {self.shard_by})")
+            articles = shard_urls(articles, self.shard, self.shards, self.shard_by, count=self.article_urls)
 
+        ledger = getattr(self, "ledger", None) # set by TestLedgerPipeline in JOBDIR jobs
         for url in articles:
+            # the stored body of url was tested in an earlier run of this job
+            if ledger is not None and self.tested(ledger, url, self.digest(url)):
+                self.crawler.stats.inc_value("test_ledger/skipped_urls")
+                continue
             yield scrapy.Request(
                 url,
                 self.parse,
+                # on resume the ledger decides what is done, requests of the previous run may be in JOBDIR/requests.bloom
+                dont_filter=ledger is not None and ledger.resumed,
             )
 
+    def tested(self, ledger, url, digest):
+        # False for an url without offset/frequency (logged by get_test_parameters), requested so parse reports it
+        try:
+            pairs = test_pairs(self, url)
+        except SystemError:
+            return False
+        return ledger.done(url, pairs, digest)
+
+    def digest(self, url, article=None):
+        # of the body the tests run on: the snapshot stored for url, or the article when snapshots are off
+        store = getattr(self, "snapshot_store", None)
+        if store is not None:
+            return store.digest(url)
+        return content_digest(article.get()) if article else None
+
     def parse(self, response):
-        url = response.url
-        article = response.css("div.RichTextArticleBody-body.RichTextBody")
+        # the requested url, as SnapshotMiddleware stores it and start_requests checks it in the ledger, even if redirected
+        url = response.meta.get("redirect_urls", [response.url])[0]
+        article = article_body(response, self) # the body subtree only, not the whole page
         if article:
+            digest = self.digest(url, article)
+            ledger = getattr(self, "ledger", None)
+            if ledger is not None:
+                try:
+                    pairs = test_pairs(self, url)
+                except Exception as e:
+                    self.logger.critical(f"UNEXPECTED ERROR: {e}")
+                    return
+                if ledger.done(url, pairs, digest):
+                    self.logger.info(f"Already tested in this job: {url}")
+                    self.crawler.stats.inc_value("test_ledger/skipped_tests")
+                    return
+            if self.settings.getint("VALIDATION_WORKERS", 0) > 0:
+                yield ArticleItem(url=url, article=article.get(), digest=digest) # tested by ValidationPipeline
+                return
             try:
-                tests = clean_data_and_run_tests(self, url, article)
+                results = clean_data_and_run_tests(self, url, article)
             except Exception as e:
                 self.logger.critical(f"UNEXPECTED ERROR: {e}")
+            else:
+                yield ArticleItem(url=url, reports=results, digest=digest) # stored by ReportStorePipeline
         else:
             self.logger.error(f"No Article found at {url}")
-        yield None       
+
+    def closed(self, reason):
+        if self.test_config is not None:
+            self.test_config.close()
 
 
 # Use to test authentication through Scrapy Middleware (LoginMiddleware)
 class TestAuthSpider(scrapy.Spider):
     name = "test-auth"
 
-    start_urls = ["https://qa.brightspot.chronicle.com/article/how-to-get-your-students-to-read"]
+    def start_requests(self):
+        base_url = self.settings.get("BASE_URL", BASE_URL).rstrip("/")
+        yield scrapy.Request(f"{base_url}/article/how-to-get-your-students-to-read", self.parse)
 
     def parse(self, response):
         self.logger.info("Visited URL: %s", response.url)
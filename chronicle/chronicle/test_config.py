@@ -0,0 +1,138 @@
+import csv
+import os
+import re
+import sqlite3
+from fnmatch import translate
+from functools import lru_cache
+from pathlib import Path
+from urllib.parse import urlsplit
+from chronicle.dupefilter import canonical_url
+
+RULE_KINDS = ("url", "pattern", "section")
+CSV_COLUMNS = ("kind", "rule", "offset", "frequency")
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rules (
+    kind TEXT NOT NULL,
+    rule TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    frequency INTEGER NOT NULL,
+    PRIMARY KEY (kind, rule)
+);
+"""
+
+
+def rule_row(kind, rule, offset, frequency, where):
+    # (kind, rule, offset, frequency) as stored: urls canonical, sections as "/path" prefixes
+    kind = (kind or "").strip().lower()
+    rule = (rule or "").strip()
+    if kind not in RULE_KINDS:
+        raise ValueError(f"{where}: kind must be one of {RULE_KINDS}, not {kind!r}")
+    if not rule:
+        raise ValueError(f"{where}: empty rule")
+    try:
+        offset, frequency = int(offset), int(frequency)
+    except (TypeError, ValueError):
+        raise ValueError(f"{where}: offset and frequency must be numbers") from None
+    if offset < 1 or frequency < 1:
+        raise ValueError(f"{where}: offset and frequency must be at least 1")
+    if kind == "url":
+        rule = canonical_url(rule)
+    elif kind == "section":
+        rule = "/" + rule.strip("/")
+    return kind, rule, offset, frequency
+
+
+def build_index(csv_path, db_path):
+    # Rules of a csv (header: kind,rule,offset,frequency) into a new SQLite file, swapped in once complete.
+    # A later row with the same kind and rule replaces the earlier one
+    tmp_path = f"{db_path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.executescript(SCHEMA)
+        with open(csv_path, "r", newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            missing = set(CSV_COLUMNS) - set(reader.fieldnames or ())
+            if missing:
+                raise ValueError(f"{csv_path}: missing columns {sorted(missing)}")
+            rows = (
+                rule_row(row["kind"], row["rule"], row["offset"], row["frequency"], f"{csv_path}:{line}")
+                for line, row in enumerate(reader, start=2)
+            )
+            connection.executemany("INSERT OR REPLACE INTO rules (kind, rule, offset, frequency) VALUES (?, ?, ?, ?)", rows)
+        connection.commit()
+    except Exception:
+        connection.close()
+        os.remove(tmp_path)
+        raise
+    connection.close()
+    os.replace(tmp_path, db_path)
+
+
+def section_prefixes(path):
+    # "/a/b/c" -> ["/a/b/c", "/a/b", "/a", "/"]
+    parts = [part for part in path.split("/") if part]
+    return ["/" + "/".join(parts[:end]) for end in range(len(parts), -1, -1)]
+
+
+class TestConfig:
+    """(OFFSET, FREQUENCY) RULES OF URLS IN SQLITE (OR A CSV INDEXED INTO ONE). NOTHING IS READ BEFORE THE FIRST LOOKUP."""
+
+    def __init__(self, path, cache_size=10000):
+        self.path = path
+        self.connection = None
+        self.patterns = []
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def open(self):
+        # a .csv is indexed into <path>.db the first time and again whenever it changes
+        if self.connection is not None:
+            return self.connection
+        db_path = self.path
+        if self.path.endswith(".csv"):
+            db_path = f"{self.path}.db"
+            if not os.path.exists(db_path) or os.path.getmtime(db_path) < os.path.getmtime(self.path):
+                build_index(self.path, db_path)
+        elif not os.path.exists(db_path):
+            raise FileNotFoundError(f"TEST_CONFIG {db_path} not found")
+        self.connection = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+        # patterns are few and tried one by one, in file order
+        self.patterns = [
+            (re.compile(translate(rule)), offset, frequency)
+            for rule, offset, frequency in self.connection.execute(
+                "SELECT rule, offset, frequency FROM rules WHERE kind = 'pattern' ORDER BY rowid"
+            )
+        ]
+        return self.connection
+
+    def _lookup(self, url):
+        # (offset, frequency) of the first match: the url itself, a pattern, the longest section (path prefix). None: no rule
+        connection = self.open()
+        canonical = canonical_url(url)
+        row = connection.execute(
+            "SELECT offset, frequency FROM rules WHERE kind = 'url' AND rule = ?", (canonical,)
+        ).fetchone()
+        if row:
+            return row
+        for pattern, offset, frequency in self.patterns:
+            if pattern.match(url) or pattern.match(canonical):
+                return offset, frequency
+        sections = section_prefixes(urlsplit(canonical).path)
+        row = connection.execute(
+            f"SELECT offset, frequency FROM rules WHERE kind = 'section' AND rule IN ({', '.join('?' * len(sections))}) "
+            "ORDER BY length(rule) DESC LIMIT 1",
+            sections,
+        ).fetchone()
+        return row
+
+    def urls(self):
+        # urls of the url rules, streamed
+        for (url,) in self.open().execute("SELECT rule FROM rules WHERE kind = 'url' ORDER BY rowid"):
+            yield url
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        self.lookup.cache_clear()
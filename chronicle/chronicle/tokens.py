@@ -0,0 +1,78 @@
+from array import array
+
+# Tag-kind codes of a cleaned article, one byte per tag. Tags outside the table get the codes after it, numbered per article
+# (ArticleTokens.extra_names keeps their names for failure details), and 'other' past the 127th code.
+# 'ad' is the marker RunTests appends to groups (or a literal <ad> tag), AD_FLAG marks elements with google_ad="true".
+KIND_NAMES = ('other', 'p', 'h', 'div', 'div-aligned', 'ul', 'ol', 'blockquote', 'ad', 'figure', 'table', 'iframe', 'hr')
+KIND_CODES = {name: code for code, name in enumerate(KIND_NAMES)}
+OTHER, P, H, DIV, DIV_ALIGNED, UL, OL, BLOCKQUOTE, AD = range(9)
+
+AD_FLAG = 0x80
+AD_MARK = bytes([AD])
+STRIP_AD_FLAG = bytes(code & ~AD_FLAG for code in range(256))
+# codes of the table kept, the ones numbered per article turned into OTHER (ad flag kept)
+TABLE_CODES = bytes(code if code & ~AD_FLAG < len(KIND_NAMES) else OTHER | code & AD_FLAG for code in range(256))
+
+
+def tag_code(name, is_ad=False, extra=None):
+    # extra: name -> code of the tags outside the table met so far in the article, filled here. Without it they are OTHER
+    code = KIND_CODES.get(name)
+    if code is None:
+        code = extra.get(name) if extra is not None else OTHER
+        if code is None:
+            code = len(KIND_NAMES) + len(extra)
+            if code < AD_FLAG:
+                extra[name] = code
+            else:
+                code = OTHER
+    return code | AD_FLAG if is_ad else code
+
+
+def tag_names(kinds, names=KIND_NAMES):
+    return [names[kind] for kind in kinds]
+
+
+class ArticleTokens:
+    """CLEANED ARTICLE AS BYTES OF TAG CODES AND SOURCE OFFSETS (POSITION AMONG THE ARTICLE BODY CHILDREN). NO SELECTORS KEPT."""
+    __slots__ = ('codes', 'offsets', 'extra_names', 'kind_names')
+
+    def __init__(self, codes, offsets, extra_names=()):
+        self.codes = bytes(codes)
+        self.offsets = array('I', offsets)
+        self.extra_names = tuple(extra_names) # names of the codes after KIND_NAMES, see tag_code
+        self.kind_names = KIND_NAMES + self.extra_names
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __eq__(self, other):
+        return (isinstance(other, ArticleTokens) and self.codes == other.codes and self.offsets == other.offsets
+                and self.extra_names == other.extra_names)
+
+    def __repr__(self):
+        return f"ArticleTokens({self.names()})"
+
+    def __getstate__(self):
+        return self.codes, self.offsets.tobytes(), self.extra_names
+
+    def __setstate__(self, state):
+        self.codes = state[0]
+        self.offsets = array('I')
+        self.offsets.frombytes(state[1])
+        self.extra_names = state[2]
+        self.kind_names = KIND_NAMES + self.extra_names
+
+    def kinds(self): # codes without the ad flag, what the tests compare tag names with
+        return self.codes.translate(STRIP_AD_FLAG)
+
+    def is_ad(self, index):
+        return bool(self.codes[index] & AD_FLAG)
+
+    def ad_indices(self):
+        return [i for i, code in enumerate(self.codes) if code & AD_FLAG]
+
+    def names(self):
+        return tag_names(self.kinds(), self.kind_names)
+
+    def table_codes(self): # codes decodable with KIND_NAMES alone, what reports store
+        return self.codes.translate(TABLE_CODES)
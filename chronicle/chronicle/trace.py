@@ -0,0 +1,38 @@
+import logging
+from collections import deque
+
+
+class lazy:
+    """ARGUMENT OF A TRACE LINE THAT IS ONLY COMPUTED WHEN THE LINE IS FORMATTED, e.g. lazy(tag_names, group)."""
+    __slots__ = ('func', 'args')
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def __str__(self):
+        return str(self.func(*self.args))
+
+
+class Trace:
+    """STEP BY STEP LOG OF ONE ARTICLE. GOES TO THE LOGGER AT INFO WHEN THAT LEVEL IS ENABLED (VERBOSE),
+    OTHERWISE THE LAST LINES ARE KEPT UNFORMATTED AND ONLY TURNED INTO TEXT IF THE ARTICLE FAILS."""
+    __slots__ = ('logger', 'enabled', 'lines')
+
+    def __init__(self, logger, keep=True, limit=100):
+        self.logger = logger
+        self.enabled = logger.isEnabledFor(logging.INFO)
+        self.lines = deque(maxlen=limit) if keep and not self.enabled else None
+
+    # Same arguments as logger.info: a %-format string and its args, nothing is formatted here
+    def __call__(self, msg, *args):
+        if self.enabled:
+            self.logger.info(msg, *args)
+        elif self.lines is not None:
+            self.lines.append((msg, args))
+
+    # Kept lines as text, None if nothing was kept
+    def text(self):
+        if not self.lines:
+            return None
+        return "\n".join(msg % args if args else msg for msg, args in self.lines)
@@ -0,0 +1,84 @@
+import sqlite3
+import time
+
+
+class UrlIndex:
+    """URLS KNOWN TO THE DISCOVERY SPIDERS (SQLITE). FIRST SEEN, LAST CHECKED, WHETHER THE PAGE IS AN ARTICLE AND ITS ETAG/LAST-MODIFIED."""
+
+    def __init__(self, path, commit_every=500):
+        self.path = path
+        self.commit_every = commit_every
+        self.uncommitted = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            "url TEXT PRIMARY KEY, "
+            "first_seen INTEGER NOT NULL, "
+            "last_checked INTEGER, "
+            "is_article INTEGER, "
+            "etag TEXT, "
+            "last_modified TEXT)"
+        )
+        # indexes created before validators were cached
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(urls)")}
+        for column in ("etag", "last_modified"):
+            if column not in columns:
+                self.connection.execute(f"ALTER TABLE urls ADD COLUMN {column} TEXT")
+        self.connection.commit()
+
+    def _written(self):
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        self.connection.commit()
+        self.uncommitted = 0
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+    def is_known(self, url):
+        return self.connection.execute("SELECT 1 FROM urls WHERE url = ?", (url,)).fetchone() is not None
+
+    def is_classified(self, url):
+        row = self.connection.execute("SELECT is_article FROM urls WHERE url = ?", (url,)).fetchone()
+        return row is not None and row[0] is not None
+
+    def add(self, url):
+        # True if the url was not known before
+        cursor = self.connection.execute(
+            "INSERT OR IGNORE INTO urls (url, first_seen) VALUES (?, ?)", (url, int(time.time()))
+        )
+        if cursor.rowcount:
+            self._written()
+        return bool(cursor.rowcount)
+
+    def verdict(self, url):
+        # (is_article, etag, last_modified) of the last check, None if never checked
+        row = self.connection.execute(
+            "SELECT is_article, etag, last_modified FROM urls WHERE url = ? AND is_article IS NOT NULL", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        return bool(row[0]), row[1], row[2]
+
+    def classify(self, url, is_article, etag=None, last_modified=None):
+        now = int(time.time())
+        self.connection.execute(
+            "INSERT INTO urls (url, first_seen, last_checked, is_article, etag, last_modified) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(url) DO UPDATE SET last_checked = excluded.last_checked, is_article = excluded.is_article, "
+            "etag = excluded.etag, last_modified = excluded.last_modified",
+            (url, now, now, int(is_article), etag, last_modified),
+        )
+        self._written()
+
+    def touch(self, url):
+        # verdict confirmed by a 304
+        self.connection.execute("UPDATE urls SET last_checked = ? WHERE url = ?", (int(time.time()), url))
+        self._written()
+
+    def articles(self):
+        for (url,) in self.connection.execute("SELECT url FROM urls WHERE is_article = 1 ORDER BY first_seen, url"):
+            yield url
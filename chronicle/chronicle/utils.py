@@ -1,118 +1,126 @@
-from chronicle.parse_parameters import BULK_TEST, ARTICLES, FREQUENCY, OFFSET, SEARCH, LATEST
+from chronicle.parse_parameters import BULK_TEST, ARTICLES, FREQUENCY, OFFSET, SEARCH, LATEST, SITEMAP, TRACE_FAILURES, TRACE_LINES
 from bs4 import BeautifulSoup
-import json
+from lxml import etree
+from chronicle.tokens import ArticleTokens, tag_code, tag_names, P, H, DIV, DIV_ALIGNED, UL, OL, BLOCKQUOTE, AD, AD_MARK
+from chronicle.snapshots import ARTICLE_BODY_CSS
+from chronicle.trace import Trace, lazy
+from scrapy import Selector
+import logging
 import re
+import time
+
+STRING_VALUE = etree.XPath('string(.)')
+NESTED_HEADER = re.compile(r'<h[1-6]')
+WHITESPACE = re.compile(r'\s+')
+MISSING = object() # RunGridTests: missing ad injection, message is built only for the reported group
+
+# Start of a failure message -> failure kind stored with the report (chronicle.report_store)
+FAILURE_KINDS = (
+    ('Ad found at the beginning', 'ad_at_start'),
+    ('Ad found at the end', 'ad_at_end'),
+    ('Ad found before last tag', 'ad_before_last_tag'),
+    ('Ad is next to another ad', 'adjacent_ads'),
+    ('Ad is between', 'ad_next_to_avoidable'),
+    ('Ad is next to non-paragraph', 'ad_next_to_non_paragraph'),
+    ('[SOFTERROR] No ads', 'no_ads'),
+    ('Less than', 'too_frequent'),
+    ('[SOFTERROR] Aligned div', 'aligned_div'),
+    ('Missing ad injection between', 'missing_injection'),
+    ('Ad injection after avoidable', 'ad_after_avoidable'),
+    ('Bad tag found', 'bad_tag'),
+    ('At least one paragraph', 'no_paragraph_after_last_ad'),
+    ('Error: Missing ad injection in last group', 'missing_injection_last_group'),
+)
+
 
 class CleanData():
-    """CLEAN DATA. REMOVES BAD HTML, DUPLICATES, MARKS ADS AND HEADINGS. LOGS DETAILS."""
-    def __init__(self, spider, article):
+    """CLEAN DATA. REMOVES BAD HTML, DUPLICATES, MARKS ADS AND HEADINGS IN ONE PASS OVER LXML ELEMENTS. TRACES DETAILS."""
+    def __init__(self, spider, article, trace=None):
         self.spider = spider
+        self.trace = trace or Trace(spider.logger, keep=False)
         self.article = article.xpath('./*')
         self.data = {}
         self.run()
-    
-    def run(self):
-
-        self.find_and_replace_headings()  
-        self.remove_bad_html()
-        self.remove_duplicates()
-        self.find_and_mark_ad_divs()
-        self.find_and_replace_align_divs()
-        # print(f"Tags after cleaning: {[tag.root.tag for tag in self.article]}")
-        self.spider.logger.info(f'DATA CLEANED')
 
-    def find_and_replace_headings(self):
+    def run(self):
+        trace = self.trace
         header_tags = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']
-        headers_num = 0
-
-        for tag in self.article:
-            if tag.root.tag == 'div' or tag.xpath('string(.)').get().strip() == '':
-                continue
-            if tag.root.tag in header_tags:
-                headers_num += 1
-                tag.root.tag = 'h'
-                # print(f'Header {tag.root.tag} found and tag replaced with <h>')
-                self.spider.logger.info(f'Header {tag.root.tag} found and tag replaced with <h>')
-            else:
-                content = json.dumps(tag.get())
-                if any(f"<{header_tag}" in content for header_tag in header_tags):
+        headers_num = bad_num = duplicate_num = ad_num = align_num = 0
+        seen_htmls = set()
+        updated_article = []
+        codes = bytearray()
+        extra_names = {} # tags outside chronicle.tokens.KIND_NAMES -> their codes in this article
+        offsets = []
+
+        # Same rules and order as the former separate passes: headings are renamed first,
+        # so bad <p> and duplicates are judged on the renamed tag, ads and align divs only on what is left
+        for position, tag in enumerate(self.article):
+            element = tag.root
+            name = element.tag
+            text = STRING_VALUE(element)
+            html_content = etree.tostring(element, method='html', encoding='unicode', with_tail=False)
+
+            if name != 'div' and text.strip() != '':
+                if name in header_tags:
                     headers_num += 1
-                    tag.root.tag = 'h'
-                    # print(f'Nested header found in: {content}. Tag replaced with <h>')
-                    self.spider.logger.info(f'Nested header found in: {content}. Tag replaced with <h>')
-
-        self.spider.logger.info(f'{headers_num} headings replaced with <h> tags.')
-        return self.article
-
-    def _find_bad_html(self):
-        bad_indices = []
-        for index, tags in enumerate(self.article):
-            if tags.root.tag == 'p':
-                visible_text = tags.xpath('string(.)').get().strip()
-                normalized_text = re.sub(r'\s+', ' ', visible_text).strip()
+                    trace('Header %s found and tag replaced with <h>', name)
+                    element.tag = name = 'h'
+                elif NESTED_HEADER.search(html_content):
+                    headers_num += 1
+                    trace('Nested header found in <%s>. Tag replaced with <h>', name)
+                    element.tag = name = 'h'
+                if name == 'h':
+                    html_content = etree.tostring(element, method='html', encoding='unicode', with_tail=False)
+
+            if name == 'p':
+                normalized_text = WHITESPACE.sub(' ', text.strip()).strip()
                 if len(normalized_text) < 49:
-                    self.spider.logger.info(f'Bad p tag found: "{normalized_text}" with length {len(normalized_text)}')
-                    bad_indices.append(index)
-        return bad_indices
-
-    def remove_bad_html(self):
-        bad_indices = self._find_bad_html()
-        if bad_indices:
-            updated_article = [tag for index, tag in enumerate(self.article) if index not in bad_indices]
-            # Hope some DOM structure will be preserved
-            self.article = updated_article
-            self.spider.logger.info(f'Bad html removed')
-        return True
+                    bad_num += 1
+                    trace('Bad p tag found: "%s" with length %d', normalized_text, len(normalized_text))
+                    continue
 
-    def remove_duplicates(self):
-        seen_htmls = set()
-        updated_article = []
-        duplicate_num = 0
-        for tag in self.article:
-            html_content = tag.get()
-            if html_content not in seen_htmls:
-                seen_htmls.add(html_content)
-                updated_article.append(tag)
-            else:
+            if html_content in seen_htmls:
                 duplicate_num += 1
-                self.spider.logger.info(f'Duplicate removed')
-        
-        self.article = updated_article
-        self.spider.logger.info(f"{duplicate_num} duplicates removed")
-        return self.article
+                trace('Duplicate removed')
+                continue
+            seen_htmls.add(html_content)
 
-    def find_and_mark_ad_divs(self):
-        ad_num = 0
-        for tag in self.article:
-            if "ADVERTISEMENT" in tag.xpath('string(.)').get():
+            is_ad = "ADVERTISEMENT" in text
+            if is_ad:
                 ad_num += 1
-                tag.root.set("google_ad", "true")
-                self.spider.logger.info(f'<div> marked as <ad> tag')
-        self.spider.logger.info(f'{ad_num} ads marked with "google_ad" attribute.')
-        return self.article
-
-    def find_and_replace_align_divs(self):
-        align_num = 0
-        for tag in self.article:
-            if tag.root.tag == 'div' and ('data-align-right' in tag.attrib or 'data-align-left' in tag.attrib):
+                element.set("google_ad", "true")
+                trace('<%s> marked as <ad> tag', name)
+
+            if name == 'div' and ('data-align-right' in element.attrib or 'data-align-left' in element.attrib):
                 align_num += 1
-                tag.root.tag = 'div-aligned'
-                # print(f'<div> with align attribute found and replaced with <div-aligned>')
-                self.spider.logger.info(f'<div> with align right/left attribute found and replaced with <div-aligned>')
-        self.spider.logger.info(f'{align_num} align divs replaced with <div-aligned> tags.')
-        return self.article
-        
-    
+                element.tag = name = 'div-aligned'
+                trace('<div> with align right/left attribute found and replaced with <div-aligned>')
+
+            updated_article.append(tag)
+            codes.append(tag_code(name, is_ad, extra_names))
+            offsets.append(position)
+
+        self.article = updated_article
+        self.tokens = ArticleTokens(codes, offsets, extra_names)
+        trace('%d headings replaced with <h> tags, %d bad p tags removed, %d duplicates removed, '
+              '%d ads marked with "google_ad" attribute, %d align divs replaced with <div-aligned> tags.',
+              headers_num, bad_num, duplicate_num, ad_num, align_num)
+        trace('DATA CLEANED')
+
+
 class RunTests():
-    """TESTS. IMMEDIATELY RAISES IF ANY TEST FAILS. LOGS DETAILS."""
+    """TESTS ON ARTICLE TOKENS (SEE chronicle.tokens). IMMEDIATELY RAISES IF ANY TEST FAILS. TRACES DETAILS."""
 
-    def __init__(self, spider, article, offset, frequency):
+    def __init__(self, spider, article, offset, frequency, trace=None):
         self.spider = spider
+        self.trace = trace or Trace(spider.logger, keep=False)
         self.article = article
+        self.kinds = article.kinds()
+        self.names = article.kind_names # code -> tag name, with the tags outside KIND_NAMES of this article
         self.offset = int(offset)
         self.frequency = int(frequency)
-        self.paragraph_tags = ['p']
-        self.avoidable_tags = ['h', 'div', 'div-aligned', 'ul', 'ol', 'blockquote']
+        self.paragraph_tags = {P}
+        self.avoidable_tags = {H, DIV, DIV_ALIGNED, UL, OL, BLOCKQUOTE}
         self.groups = {}
         self.report = {
             'status': True,
@@ -130,53 +138,45 @@ class RunTests():
             self.report['status'] = False
             self.report['details'].append(f'{e}')
 
-    def is_ad(self, tag):
-        if tag.root.get("google_ad") == "true":
-            return True
-        else:
-            return False
-        
+    def is_ad(self, i):
+        return self.article.is_ad(i)
+
     def check_ad_position(self):
-        self.spider.logger.info('Basic ad position check')
-        for i, tag in enumerate(self.article):
-            if self.is_ad(tag):
-                if i == 0:
-                    if self.is_ad(self.article[i+1]):
-                        raise ValueError(f'Ad found at the beginning of the article')
-                elif i == len(self.article) - 1:
-                    if self.is_ad(self.article[i-1]):
-                        raise ValueError(f'Ad found at the end of the article')
-                elif i == len(self.article) - 2:
-                    if self.is_ad(self.article[i-1]):
-                        raise ValueError(f'Ad found before last tag')
-                else:
-                    previos_tag = str(self.article[i-1].root.tag)
-                    next_tag = str(self.article[i+1].root.tag)
-                    if next_tag == 'ad' or previos_tag == 'ad':
-                        raise ValueError(f'Ad is next to another ad')
-                    if (previos_tag in self.avoidable_tags) or (next_tag in self.avoidable_tags):
-                        raise ValueError(f'Ad is between {previos_tag} and {next_tag}')
-                    if (previos_tag not in self.paragraph_tags) or (next_tag not in self.paragraph_tags):
-                        raise ValueError(f'Ad is next to non-paragraph tag. Paragraph tags are: {self.paragraph_tags}')                                                             
-        self.spider.logger.info('Basic ad position test passed')
+        self.trace('Basic ad position check')
+        for i in self.article.ad_indices():
+            if i == 0:
+                if self.is_ad(i+1):
+                    raise ValueError(f'Ad found at the beginning of the article')
+            elif i == len(self.kinds) - 1:
+                if self.is_ad(i-1):
+                    raise ValueError(f'Ad found at the end of the article')
+            elif i == len(self.kinds) - 2:
+                if self.is_ad(i-1):
+                    raise ValueError(f'Ad found before last tag')
+            else:
+                previos_tag = self.kinds[i-1]
+                next_tag = self.kinds[i+1]
+                if next_tag == AD or previos_tag == AD:
+                    raise ValueError(f'Ad is next to another ad')
+                if (previos_tag in self.avoidable_tags) or (next_tag in self.avoidable_tags):
+                    raise ValueError(f'Ad is between {self.names[previos_tag]} and {self.names[next_tag]}')
+                if (previos_tag not in self.paragraph_tags) or (next_tag not in self.paragraph_tags):
+                    raise ValueError(f'Ad is next to non-paragraph tag. Paragraph tags are: {tag_names(self.paragraph_tags, self.names)}')                                                             
+        self.trace('Basic ad position test passed')
         return True
 
     def divide_tags_into_groups(self):
-        self.spider.logger.info('Dividing tags into groups')
+        self.trace('Dividing tags into groups')
         try:
-            ad_indices = [i for i, tag in enumerate(self.article) if self.is_ad(tag)]
+            ad_indices = self.article.ad_indices()
             if not ad_indices:
                 raise ValueError('[SOFTERROR] No ads found in article')
-            initial_group = [str(tag.root.tag) for tag in self.article[:ad_indices[0]]]
-            initial_group.append('ad')
+            # groups are bytes of tag kinds, the ad itself keeps its tag kind and AD marks where the group ends
+            initial_group = self.kinds[:ad_indices[0]] + AD_MARK
 
-            main_groups = [[str(tag.root.tag) for tag in self.article[ad_indices[i]:ad_indices[i+1]]] for i in range(1, len(ad_indices)-1)]
-            for group in main_groups:
-                # group.insert(0, 'ad')
-                group.append('ad')
+            main_groups = [self.kinds[ad_indices[i]:ad_indices[i+1]] + AD_MARK for i in range(1, len(ad_indices)-1)]
 
-            last_group = [str(tag.root.tag) for tag in self.article[ad_indices[-1]:]]
-            # last_group.insert(0, 'ad')
+            last_group = self.kinds[ad_indices[-1]:]
 
             self.groups = {
                 "initial_group": initial_group,
@@ -184,14 +184,25 @@ class RunTests():
                 "last_group": last_group
             }
 
-            self.spider.logger.info(f'Tags divided into groups: {self.groups}')
+            self.trace('Tags divided into groups: %s', lazy(self.group_names))
             return True
         
         except Exception as e:
             raise 
-        
+
+    def results(self):
+        return {(self.offset, self.frequency): self.report}
+
+    def group_names(self):
+        return {
+            "initial_group": tag_names(self.groups.get("initial_group", b''), self.names),
+            "main_groups": [tag_names(group, self.names) for group in self.groups.get("main_groups", [])],
+            "last_group": tag_names(self.groups.get("last_group", b''), self.names),
+        }
+
     def _test_group(self, group, freq):
-        self.spider.logger.info(f'Group: {group}')
+        trace = self.trace
+        trace('Group: %s', lazy(tag_names, group, self.names))
         counter = sum(1 for tag in group if tag in self.paragraph_tags)
         if counter < freq:
             raise ValueError(f'Less than {freq} paragraph tags, ad injection is too frequent')
@@ -200,135 +211,325 @@ class RunTests():
         count = 0
         aligned_div = False
         for i, tag in enumerate(group):
-            self.spider.logger.info(f'Current tag: {tag}, with index: {i}, count: {count}')
+            trace('Current tag: %s, with index: %d, count: %d', self.names[tag], i, count)
             if tag in self.paragraph_tags:
-                self.spider.logger.info(f'tag in paragraph tags: {tag}')
+                trace('tag in paragraph tags: %s', self.names[tag])
                 count += 1
             
             if count == freq:
-                if group[i-1] == 'div-aligned':
-                    self.spider.logger.info(f'ALIGNED DIV FOUND')
+                if group[i-1] == DIV_ALIGNED:
+                    trace('ALIGNED DIV FOUND')
                     aligned_div = True
 
                 next_index = i
                 while next_index < len(group):
                     next_index += 1
                     next_tag = group[next_index]
-                    self.spider.logger.info(f'Next tag: {next_tag}')
+                    trace('Next tag: %s', self.names[next_tag])
                     if next_tag in self.paragraph_tags:
 
                         if aligned_div:
-                            self.spider.logger.info(f'ALIGNED DIV FOUND')
+                            trace('ALIGNED DIV FOUND')
                             # try:
-                            if group[next_index+1] == 'ad':
-                                self.spider.logger.info('Ad found after 2 paragraphs with aligned div before')
+                            if group[next_index+1] == AD:
+                                trace('Ad found after 2 paragraphs with aligned div before')
                                 raise ValueError(f'[SOFTERROR] Aligned div and two paragraphs found before ad injection')
                             # except IndexError:
                             #     print(f'{}')
                             #     pass
 
-                        raise ValueError(f"Missing ad injection between paragraph tags '{group[next_index-1]}' and '{next_tag}'. Group: {group}. Frequency: {freq}. All tags: {self.groups}")
-                    elif next_tag == 'ad': # test success
-                        self.spider.logger.info('Ad found')
+                        raise ValueError(f"Missing ad injection between paragraph tags '{self.names[group[next_index-1]]}' and '{self.names[next_tag]}'. Group: {tag_names(group, self.names)}. Frequency: {freq}. All tags: {self.group_names()}")
+                    elif next_tag == AD: # test success
+                        trace('Ad found')
                         break
                     elif next_tag in self.avoidable_tags:
                         # print(f'Next tag: {next_tag}')
-                        if next_tag == 'div-aligned':
+                        if next_tag == DIV_ALIGNED:
                             aligned_div = True
-                            self.spider.logger.info(f'Aligned div found')
+                            trace('Aligned div found')
 
                         next_index += 1
-                        self.spider.logger.info(f'Avoidable tag found: {next_tag}')
-                        self.spider.logger.info(f'After avoidable tag: {group[next_index]}')
+                        trace('Avoidable tag found: %s', self.names[next_tag])
+                        trace('After avoidable tag: %s', self.names[group[next_index]])
                         while group[next_index] not in self.paragraph_tags:
-                            if group[next_index] == 'ad': 
+                            if group[next_index] == AD: 
                                 raise ValueError(f'Ad injection after avoidable tag') # this likely won't happen, ad's were already checked for neighbours
                             next_index += 1
-                            self.spider.logger.info(f'Looking for p tag after avoidable tag: {group[next_index]}')
+                            trace('Looking for p tag after avoidable tag: %s', self.names[group[next_index]])
                     else:
-                        raise ValueError(f'Bad tag found: {next_tag}')
+                        raise ValueError(f'Bad tag found: {self.names[next_tag]}')
                 break
         return True
 
     def _test_last_group(self):
         group = self.groups.get('last_group')
-        self.spider.logger.info(f'Last group: {group}')
+        self.trace('Last group: %s', lazy(tag_names, group, self.names))
         freq = self.frequency
         count = 0
-        if 'p' not in self.groups.get('last_group'):
+        if P not in group:
             raise ValueError('At least one paragraph required after last ad')
         for i, tag in enumerate(group):
-            if tag in ['p']:
+            if tag == P:
                 count += 1
                 try:
                     if count >= freq:
                         next_tag = group[i+1]
-                        if next_tag in ['p'] and (i+1) != (len(group)-1): # -1 is -'ad' tag
+                        if next_tag == P and (i+1) != (len(group)-1): # -1 is -'ad' tag
                             raise ValueError('Missing ad injection in last group')
                 except IndexError:
-                    self.spider.logger.info('IndexError [good]')
+                    self.trace('IndexError [good]')
                     return True
                 except Exception as e:
                     raise ValueError(f'Error: {e}')
-        self.spider.logger.info('Last group test passed')
+        self.trace('Last group test passed')
         return True
 
     def test_groups(self):
         try:
-            self.spider.logger.info('Testing first group')
+            self.trace('Testing first group')
             assert self._test_group(self.groups.get('initial_group'), self.offset)
 
-            self.spider.logger.info('Testing main groups')
+            self.trace('Testing main groups')
             for group in self.groups.get('main_groups'):
                 assert self._test_group(group, self.frequency)
 
-            self.spider.logger.info('Testing last group')
+            self.trace('Testing last group')
             assert self._test_last_group()
 
-            self.spider.logger.info('Groups tests passed')
+            self.trace('Groups tests passed')
             return True
         except Exception as e:
             raise
 
-def clean_data_and_run_tests(spider, url, article, bulk_test=BULK_TEST):
-    """CLEAN DATA AND RUN TESTS. RETURNS TEST OBJECT."""
-    try:
-        if SEARCH or LATEST:
-            frequency = int(FREQUENCY)
-            offset = int(OFFSET)
+
+class RunGridTests(RunTests):
+    """SAME TESTS AS RunTests FOR EVERY OFFSET/FREQUENCY PAIR AT ONCE. ONE SCAN PER GROUP, REPORTS A PASS/FAIL MATRIX."""
+
+    def __init__(self, spider, article, offsets=range(1, 8), frequencies=range(1, 8), trace=None):
+        self.offsets = list(offsets)
+        self.frequencies = list(frequencies)
+        self.reports = {} # (offset, frequency) -> report, same as RunTests(offset, frequency).report
+        self.matrix = {} # (offset, frequency) -> status, soft errors count as passed
+        super().__init__(spider, article, offset=0, frequency=0, trace=trace)
+
+    def run(self):
+        try:
+            assert self.check_ad_position()
+            assert self.divide_tags_into_groups()
+        except Exception as e:
+            details = {pair: f'{e}' for pair in self._pairs()}
         else:
-            frequency = int(ARTICLES.get(url).get('frequency'))
-            offset = int(ARTICLES.get(url).get('offset'))
+            details = self.test_grid()
+
+        for pair, detail in details.items():
+            self.reports[pair] = {'status': detail is None, 'details': [detail] if detail else []}
+            self.matrix[pair] = detail is None or '[SOFTERROR]' in detail
+        self.report['status'] = all(self.matrix.values())
+        self.report['details'] = [f'offset: {offset}, frequency: {frequency}. {detail}' for (offset, frequency), detail in details.items() if detail]
+
+    def results(self):
+        return self.reports
+
+    def _pairs(self):
+        return [(offset, frequency) for frequency in self.frequencies for offset in self.offsets]
+
+    def _group_outcomes(self, group):
+        # What _test_group finds after the paragraph at index x, for every paragraph x: (outcome, outcome with aligned div seen).
+        # None means ad found, MISSING is formatted later. Built right to left, each paragraph reuses the result of the next one.
+        n = len(group)
+        outcomes = {}
+        for x in range(n - 1, -1, -1):
+            if group[x] not in self.paragraph_tags:
+                continue
+            y = x + 1
+            if y >= n:
+                outcomes[x] = ('index out of range', 'index out of range')
+                continue
+            next_tag = group[y]
+            if next_tag in self.paragraph_tags:
+                if y + 1 >= n:
+                    aligned = 'index out of range'
+                elif group[y + 1] == AD:
+                    aligned = '[SOFTERROR] Aligned div and two paragraphs found before ad injection'
+                else:
+                    aligned = MISSING
+                outcomes[x] = (MISSING, aligned)
+            elif next_tag == AD:
+                outcomes[x] = (None, None)
+            elif next_tag in self.avoidable_tags:
+                z = y + 1
+                while z < n and group[z] not in self.paragraph_tags and group[z] != AD:
+                    z += 1
+                if z >= n:
+                    outcomes[x] = ('index out of range', 'index out of range')
+                elif group[z] == AD:
+                    outcomes[x] = ('Ad injection after avoidable tag', 'Ad injection after avoidable tag')
+                else:
+                    plain, aligned = outcomes[z]
+                    outcomes[x] = (aligned if next_tag == DIV_ALIGNED else plain, aligned)
+            else:
+                outcomes[x] = (f'Bad tag found: {self.names[next_tag]}',) * 2
+        return outcomes
+
+    def _grid_group(self, group, freqs):
+        # freq -> first error of _test_group(group, freq) or None, MISSING left for _grid_detail
+        paragraphs = [i for i, tag in enumerate(group) if tag in self.paragraph_tags]
+        outcomes = self._group_outcomes(group)
+        results = {}
+        for freq in freqs:
+            if len(paragraphs) < freq:
+                results[freq] = f'Less than {freq} paragraph tags, ad injection is too frequent'
+                continue
+            i = paragraphs[freq - 1]
+            results[freq] = outcomes[i][group[i-1] == DIV_ALIGNED]
+        return results
+
+    def _grid_detail(self, outcome, group, freq):
+        # Only for the errors that get reported: the message has every tag of the article
+        if outcome is MISSING:
+            return (f"Missing ad injection between paragraph tags 'p' and 'p'. Group: {tag_names(group, self.names)}. "
+                    f"Frequency: {freq}. All tags: {self.group_names()}")
+        return outcome
+
+    def _grid_last_group(self, freqs):
+        group = self.groups.get('last_group')
+        if P not in group:
+            return {freq: 'At least one paragraph required after last ad' for freq in freqs}
+        # _test_last_group fails for freq when a paragraph counted at or after freq is followed by another one
+        max_rank = 0
+        rank = 0
+        for i, tag in enumerate(group):
+            if tag == P:
+                rank += 1
+                if i + 1 < len(group) - 1 and group[i+1] == P:
+                    max_rank = rank
+        return {freq: 'Error: Missing ad injection in last group' if freq <= max_rank else None for freq in freqs}
+
+    def test_grid(self):
+        self.trace('Testing groups for all offset/frequency pairs')
+        initial_group = self.groups.get('initial_group')
+        initial = self._grid_group(initial_group, self.offsets)
+        initial = {offset: self._grid_detail(outcome, initial_group, offset) for offset, outcome in initial.items()}
+        main_groups = self.groups.get('main_groups')
+        main = [self._grid_group(group, self.frequencies) for group in main_groups]
+        last = self._grid_last_group(self.frequencies)
+
+        by_frequency = {}
+        for freq in self.frequencies:
+            failed = next(((group, results[freq]) for group, results in zip(main_groups, main) if results[freq] is not None), None)
+            by_frequency[freq] = self._grid_detail(failed[1], failed[0], freq) if failed else last[freq]
+
+        return {(offset, freq): initial[offset] if initial[offset] is not None else by_frequency[freq] for offset, freq in self._pairs()}
+
+
+def log_report(spider, url, offset, frequency, report):
+    try:
+        if '[SOFTERROR]' in report.get('details')[0]:
+            report['status'] = True
+    except Exception:
+        pass
+
+    if report.get('status'):
+        spider.logger.warning(f"ALL TESTS PASSED. URL: {url}, offset: {offset}, frequency: {frequency}, DETAILS: {report.get('details')}")
+    else:
+        spider.logger.error(f"TEST FAILED. URL: {url}, offset: {offset}, frequency: {frequency}. DETAILS: {report.get('details')}")
+
+
+def log_trace(spider, url, results):
+    # trace of a failed article, attached to its failed reports by run_article_tests
+    trace = next((report['trace'] for report in results.values() if report.get('trace')), None)
+    if trace:
+        spider.logger.warning(f"TRACE OF {url}:\n{trace}")
+
+
+def failure_kind(report):
+    """RETURNS THE KIND OF THE FIRST FAILURE OF A REPORT, None IF IT PASSED."""
+    details = report.get('details')
+    if not details:
+        return None
+    for prefix, kind in FAILURE_KINDS:
+        if details[0].startswith(prefix):
+            return kind
+    if 'index out of range' in details[0]:
+        return 'index_error' # a group ended where a tag was expected
+    return 'other'
+
+
+def get_test_parameters(spider, url):
+    """RETURNS (offset, frequency) FOR URL. TEST_CONFIG RULES FIRST (spider.test_config), THEN FREQUENCY/OFFSET OR ARTICLES."""
+    config = getattr(spider, 'test_config', None)
+    rule = config.lookup(url) if config is not None else None
+    if rule is not None:
+        offset, frequency = rule
+    elif SEARCH or LATEST or SITEMAP:
+        frequency = int(FREQUENCY)
+        offset = int(OFFSET)
+    else:
+        parameters = ARTICLES.get(url, {})
+        frequency = int(parameters.get('frequency') or 0)
+        offset = int(parameters.get('offset') or 0)
+
+    if not frequency or not offset:
+        spider.logger.error(f"Frequency or offset not set for URL: {url}")
+        raise SystemError(f"Frequency or offset not set for URL: {url}")
+    return offset, frequency
+
+
+def test_pairs(spider, url, bulk_test=BULK_TEST):
+    """RETURNS THE (offset, frequency) PAIRS URL IS TESTED WITH."""
+    if bulk_test:
+        return {(offset, frequency) for offset in range(1, 8) for frequency in range(1, 8)}
+    return {get_test_parameters(spider, url)}
+
+
+def run_article_tests(spider, article, offset, frequency, bulk_test=BULK_TEST):
+    """CLEAN DATA ONCE AND RUN TESTS. RETURNS {(offset, frequency): report}, EACH REPORT WITH THE TAG CODES IT WAS RUN ON.
+    FAILED REPORTS ALSO GET THE TRACE OF THE ARTICLE WHEN TRACE_FAILURES IS ON AND INFO LOGS ARE OFF."""
+    trace = Trace(spider.logger, keep=TRACE_FAILURES, limit=TRACE_LINES)
+    started = time.perf_counter()
+    clean_article = CleanData(spider=spider, article=article, trace=trace)
+    cleaned = time.perf_counter()
+    if bulk_test:
+        # All 49 pairs answered from one scan of the tokens
+        test = RunGridTests(spider=spider, article=clean_article.tokens, offsets=range(1, 8), frequencies=range(1, 8), trace=trace)
+    else:
+        test = RunTests(spider=spider, article=clean_article.tokens, frequency=frequency, offset=offset, trace=trace)
+    results = test.results()
+    timings = {'clean': cleaned - started, 'tests': time.perf_counter() - cleaned} # for chronicle.extensions.StageTimings
+    failed = [report for report in results.values() if not report['status'] and '[SOFTERROR]' not in report['details'][0]]
+    text = trace.text() if failed else None # formatted only here, once per failed article
+    tokens = clean_article.tokens.table_codes() # stored as KIND_NAMES codes, the names of other tags are in the details
+    for report in results.values():
+        report['tokens'] = tokens # one bytes object shared by all reports
+        report['timings'] = timings
+    for report in failed:
+        report['trace'] = text
+    return results
+
 
+def clean_data_and_run_tests(spider, url, article, bulk_test=BULK_TEST):
+    """CLEAN DATA AND RUN TESTS. RETURNS {(offset, frequency): report}."""
+    try:
+        offset, frequency = get_test_parameters(spider, url)
         spider.logger.info(f"TESTING URL: {url}, offset: {offset}, frequency: {frequency}")
-        if not frequency or not offset:
-            spider.logger.error(f"Frequency or offset not set for URL: {url}")
-            raise SystemError(f"Frequency or offset not set for URL: {url}")
-
-        def _logic(spider=spider, url = url, article=article, frequency=frequency, offset=offset):
-            clean_article = CleanData(spider=spider, article=article)
-            test = RunTests(spider=spider, article=clean_article.article, frequency=frequency, offset=offset)
-
-            try:
-                if '[SOFTERROR]' in test.report.get('details')[0]:
-                    test.report['status'] = True
-            except Exception:
-                pass
-
-            if test.report.get('status'):
-                spider.logger.warning(f"ALL TESTS PASSED. URL: {url}, offset: {offset}, frequency: {frequency}, DETAILS: {test.report.get('details')}")
-            else:
-                spider.logger.error(f"TEST FAILED. URL: {url}, offset: {offset}, frequency: {frequency}. DETAILS: {test.report.get('details')}")
-            return test
-        
-        if bulk_test:
-            tests = []
-            for freq in range(1, 8):
-                for off in range(1, 8):
-                    test = _logic(spider=spider, url=url, article=article, frequency=freq, offset=off)
-                    tests.append(test)
-            return tests
-        else:
-            return _logic()
+
+        results = run_article_tests(spider, article, offset, frequency, bulk_test)
+        for (off, freq), report in results.items():
+            log_report(spider, url, off, freq, report)
+        log_trace(spider, url, results)
+        return results
     except Exception as e:
-        raise
\ No newline at end of file
+        raise
+
+
+class WorkerSpider():
+    """STAND-IN FOR THE SPIDER IN VALIDATION WORKER PROCESSES. CleanData AND RunTests ONLY USE ITS LOGGER."""
+    def __init__(self, name):
+        self.name = name
+        self.logger = logging.getLogger(name)
+
+
+def run_tests_in_worker(spider_name, html, offset, frequency, bulk_test=BULK_TEST):
+    """ENTRY POINT OF chronicle.pipelines.ValidationPipeline WORKERS. TAKES THE ARTICLE BODY HTML, RETURNS PICKLABLE REPORTS."""
+    article = Selector(text=html).css(ARTICLE_BODY_CSS)
+    return run_article_tests(WorkerSpider(spider_name), article, offset, frequency, bulk_test)